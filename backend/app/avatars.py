@@ -0,0 +1,229 @@
+import hashlib
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from typing import AsyncIterator, Dict, Any, Optional, Tuple
+
+import anyio
+from PIL import Image, ImageOps
+
+CURRENT_DIR = os.path.dirname(os.path.abspath(__file__))
+DATABASE_PATH = os.path.abspath(os.path.join(CURRENT_DIR, "..", "diabetes.db"))
+AVATAR_DIR = os.path.abspath(os.path.join(CURRENT_DIR, "..", "static", "avatars"))
+AVATAR_THUMBNAIL_DIR = os.path.join(AVATAR_DIR, "thumbs")
+
+AVATAR_MAX_BYTES = 5 * 1024 * 1024
+# PNG nén tốt có thể rất nhỏ trên đĩa nhưng cực lớn khi giải nén
+AVATAR_MAX_PIXELS = 24_000_000
+THUMBNAIL_SIZES = (48, 128, 256)
+
+# Tệp được đặt tên theo sha256 nội dung nên có thể cache vĩnh viễn
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+# (chữ ký đầu tệp, phần mở rộng, content type)
+IMAGE_SIGNATURES = [
+    (b"\xff\xd8\xff", "jpg", "image/jpeg"),
+    (b"\x89PNG\r\n\x1a\n", "png", "image/png"),
+    (b"GIF87a", "gif", "image/gif"),
+    (b"GIF89a", "gif", "image/gif"),
+]
+
+AVATAR_SCHEMA = """
+CREATE TABLE IF NOT EXISTS patient_avatar (
+    patient_id INTEGER PRIMARY KEY,
+    sha256 TEXT NOT NULL,
+    extension TEXT NOT NULL,
+    content_type TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    updated_at REAL NOT NULL
+);
+"""
+
+_thumbnail_lock = threading.Lock()
+
+
+def ensure_avatar_storage(database_path: str = DATABASE_PATH) -> None:
+    os.makedirs(AVATAR_THUMBNAIL_DIR, exist_ok=True)
+    conn = sqlite3.connect(database_path)
+    try:
+        conn.executescript(AVATAR_SCHEMA)
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def _sniff_image(head: bytes) -> Optional[Tuple[str, str]]:
+    for signature, extension, content_type in IMAGE_SIGNATURES:
+        if head.startswith(signature):
+            return extension, content_type
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "webp", "image/webp"
+    return None
+
+
+def avatar_path(sha256: str, extension: str) -> str:
+    return os.path.join(AVATAR_DIR, f"{sha256}.{extension}")
+
+
+def _check_patient(patient_id: int) -> None:
+    conn = sqlite3.connect(DATABASE_PATH)
+    try:
+        cursor = conn.cursor()
+        cursor.execute("SELECT COUNT(*) FROM personal WHERE patient_id = ?", (patient_id,))
+        if cursor.fetchone()[0] == 0:
+            raise LookupError(f"Patient with ID {patient_id} not found")
+    finally:
+        conn.close()
+
+
+def _verify_image(path: str) -> None:
+    # Chữ ký đầu tệp đúng chưa chắc là ảnh đọc được: giải mã thử toàn bộ trước khi lưu,
+    # nếu không ảnh hỏng chỉ lộ ra khi tạo thumbnail
+    try:
+        with Image.open(path) as image:
+            if image.width * image.height > AVATAR_MAX_PIXELS:
+                raise ValueError(f"Avatar exceeds {AVATAR_MAX_PIXELS} pixels")
+            image.load()
+    except ValueError:
+        raise
+    except Exception as e:
+        # Không trả lỗi gốc của Pillow về client: có chứa đường dẫn tệp tạm
+        print(f"Error decoding avatar: {e}")
+        raise ValueError("Invalid image data")
+
+
+def _store_avatar(patient_id: int, tmp_path: str, sha256: str, image_type: Tuple[str, str], size: int) -> None:
+    extension, content_type = image_type
+    final_path = avatar_path(sha256, extension)
+    try:
+        _verify_image(tmp_path)
+        # Cùng nội dung thì dùng lại tệp đã có
+        if os.path.exists(final_path):
+            os.remove(tmp_path)
+        else:
+            os.replace(tmp_path, final_path)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+    conn = sqlite3.connect(DATABASE_PATH)
+    try:
+        conn.execute(
+            """
+            INSERT INTO patient_avatar (patient_id, sha256, extension, content_type, size, updated_at)
+            VALUES (?, ?, ?, ?, ?, ?)
+            ON CONFLICT (patient_id) DO UPDATE SET
+                sha256 = excluded.sha256,
+                extension = excluded.extension,
+                content_type = excluded.content_type,
+                size = excluded.size,
+                updated_at = excluded.updated_at
+            """,
+            (patient_id, sha256, extension, content_type, size, time.time())
+        )
+        conn.commit()
+    finally:
+        conn.close()
+
+
+async def save_avatar_logic(patient_id: int, chunks: AsyncIterator[bytes]) -> Dict[str, Any]:
+    # Việc chặn (sqlite, ghi đĩa, giải mã ảnh) chạy trong luồng phụ để không chặn event loop
+    await anyio.to_thread.run_sync(_check_patient, patient_id)
+
+    # Đọc thẳng thân request theo từng khối, vừa ghi vừa băm: không spool toàn bộ
+    # ảnh trước, và dừng ngay khi vượt giới hạn kích thước
+    digest = hashlib.sha256()
+    size = 0
+    head = b""
+    image_type = None
+    fd, tmp_path = tempfile.mkstemp(dir=AVATAR_DIR, suffix=".upload")
+    try:
+        with os.fdopen(fd, "wb") as tmp:
+            async for chunk in chunks:
+                if not chunk:
+                    continue
+                size += len(chunk)
+                if size > AVATAR_MAX_BYTES:
+                    raise ValueError(f"Avatar exceeds {AVATAR_MAX_BYTES} bytes")
+                # Khối đầu có thể rất ngắn; gom đủ byte đầu tệp rồi mới nhận dạng
+                if image_type is None and len(head) < 12:
+                    head += chunk[:12 - len(head)]
+                    if len(head) >= 12:
+                        image_type = _sniff_image(head)
+                        if image_type is None:
+                            raise ValueError("Unsupported image format")
+                digest.update(chunk)
+                await anyio.to_thread.run_sync(tmp.write, chunk)
+
+        if size == 0:
+            raise ValueError("Empty upload")
+        if image_type is None:
+            image_type = _sniff_image(head)
+            if image_type is None:
+                raise ValueError("Unsupported image format")
+    except BaseException:
+        # BaseException: cả khi client ngắt kết nối (request bị hủy) cũng phải dọn tệp tạm
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+    sha256 = digest.hexdigest()
+    await anyio.to_thread.run_sync(_store_avatar, patient_id, tmp_path, sha256, image_type, size)
+
+    return {
+        "message": "Avatar uploaded successfully",
+        "patient_id": patient_id,
+        "avatar": avatar_urls(sha256)
+    }
+
+
+def avatar_urls(sha256: str) -> Dict[str, Any]:
+    return {
+        "sha256": sha256,
+        "url": f"/api/avatars/{sha256}",
+        "thumbnails": {size: f"/api/avatars/{sha256}/thumb/{size}" for size in THUMBNAIL_SIZES}
+    }
+
+
+def get_avatar_file(sha256: str) -> Optional[Tuple[str, str]]:
+    conn = sqlite3.connect(DATABASE_PATH)
+    try:
+        row = conn.execute(
+            "SELECT extension, content_type FROM patient_avatar WHERE sha256 = ? LIMIT 1",
+            (sha256,)
+        ).fetchone()
+    finally:
+        conn.close()
+
+    if not row:
+        return None
+    extension, content_type = row
+    path = avatar_path(sha256, extension)
+    if not os.path.exists(path):
+        return None
+    return path, content_type
+
+
+def get_avatar_thumbnail(sha256: str, size: int) -> Optional[Tuple[str, str]]:
+    original = get_avatar_file(sha256)
+    if original is None:
+        return None
+
+    thumbnail_path = os.path.join(AVATAR_THUMBNAIL_DIR, f"{sha256}-{size}.jpg")
+    if os.path.exists(thumbnail_path):
+        return thumbnail_path, "image/jpeg"
+
+    # Chỉ tạo một lần; các request sau dùng tệp đã cache trên đĩa
+    with _thumbnail_lock:
+        if not os.path.exists(thumbnail_path):
+            with Image.open(original[0]) as image:
+                image = ImageOps.exif_transpose(image)
+                thumbnail = ImageOps.fit(image.convert("RGB"), (size, size), Image.LANCZOS)
+            tmp_path = thumbnail_path + ".tmp"
+            thumbnail.save(tmp_path, format="JPEG", quality=85, optimize=True)
+            os.replace(tmp_path, thumbnail_path)
+
+    return thumbnail_path, "image/jpeg"
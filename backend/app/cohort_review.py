@@ -0,0 +1,220 @@
+import argparse
+import json
+import multiprocessing
+import os
+import sqlite3
+import sys
+import tempfile
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, Iterator, List, Tuple
+
+from app.cohort_scoring import Chunk, _score_chunk
+from app.recommendations import _load_inputs
+from app.sparql_utils import capture_drug_disadvantages, ontology_term, suitable_drugs_for
+
+CURRENT_DIR = os.path.dirname(os.path.abspath(__file__))
+DATABASE_PATH = os.path.abspath(os.path.join(CURRENT_DIR, "..", "diabetes.db"))
+
+COHORT_CHUNK_SIZE = 200
+COHORT_MAX_CHUNK_SIZE = 5000
+COHORT_MAX_WORKERS = os.cpu_count() or 1
+# Mỗi request qua API không được chiếm hết CPU của server
+COHORT_MAX_REQUEST_WORKERS = 4
+
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+
+COHORT_REVIEW_FIELDS = [
+    "patientId", "name", "age", "gender", "diabetesType", "diseaseDuration",
+    "hba1c", "hba1cTarget", "hba1cGap", "eligibleDrugs", "rankedDrugs"
+]
+
+
+def open_cohort_snapshot(database_path: str = DATABASE_PATH) -> Tuple[sqlite3.Connection, str]:
+    # Sao chép CSDL bằng backup API: bản chụp nhất quán tại một thời điểm, chỉ giữ
+    # khóa đọc trong lúc sao chép nên không chặn thao tác ghi suốt quá trình stream
+    fd, snapshot_path = tempfile.mkstemp(prefix="cohort-", suffix=".db")
+    os.close(fd)
+
+    source = sqlite3.connect(database_path)
+    snapshot = sqlite3.connect(snapshot_path, check_same_thread=False)
+    try:
+        source.backup(snapshot)
+    except Exception:
+        snapshot.close()
+        os.remove(snapshot_path)
+        raise
+    finally:
+        source.close()
+
+    return snapshot, snapshot_path
+
+
+def _load_eligibility_inputs(cursor: sqlite3.Cursor, patient_ids: List[int]) -> tuple:
+    # Tiền sử và phản ứng thuốc lấy từ chính bản chụp CSDL, không đọc ontology đang
+    # thay đổi: CSDL được ghi trước ontology nên bản chụp luôn là trạng thái đã chốt
+    placeholders = ", ".join("?" for _ in patient_ids)
+
+    cursor.execute(
+        f"SELECT patient_id, condition FROM medical_history WHERE patient_id IN ({placeholders})",
+        patient_ids
+    )
+    conditions: Dict[int, set] = {}
+    for patient_id, condition in cursor.fetchall():
+        conditions.setdefault(patient_id, set()).add(ontology_term(condition))
+
+    cursor.execute(
+        f"SELECT patient_id, drug FROM adverse_reaction WHERE patient_id IN ({placeholders})",
+        patient_ids
+    )
+    adverse: Dict[int, set] = {}
+    for patient_id, drug in cursor.fetchall():
+        adverse.setdefault(patient_id, set()).add(ontology_term(drug))
+
+    return conditions, adverse
+
+
+def _load_stage(conn: sqlite3.Connection, chunk_size: int) -> Iterator[Chunk]:
+    # Phân trang theo khóa để mỗi lần chỉ giữ một khối bệnh nhân trong bộ nhớ
+    cursor = conn.cursor()
+    last_id = 0
+    while True:
+        cursor.execute(
+            """
+            SELECT
+                p.patient_id, p.name, p.age, p.gender,
+                d.type_of_diabetes, d.disease_duration, d.hba1c
+            FROM personal p
+            LEFT JOIN diabete d ON d.diabete_id = (
+                SELECT max(diabete_id) FROM diabete WHERE patient_id = p.patient_id
+            )
+            WHERE p.patient_id > ?
+            ORDER BY p.patient_id
+            LIMIT ?
+            """,
+            (last_id, chunk_size)
+        )
+        rows = cursor.fetchall()
+        if not rows:
+            return
+
+        patient_ids = [row[0] for row in rows]
+        diabetes, histories = _load_inputs(cursor, patient_ids)
+        conditions, adverse = _load_eligibility_inputs(cursor, patient_ids)
+
+        yield [
+            {
+                "patientId": patient_id,
+                "name": name,
+                "age": age,
+                "gender": gender,
+                "diabetesType": diabetes_type,
+                "diseaseDuration": duration,
+                "hba1c": hba1c,
+                "diabetesCodes": diabetes.get(patient_id),
+                "history": histories.get(patient_id, {}),
+                "conditions": conditions.get(patient_id, set()),
+                "adverseDrugs": adverse.get(patient_id, set())
+            }
+            for patient_id, name, age, gender, diabetes_type, duration, hba1c in rows
+        ]
+        last_id = patient_ids[-1]
+
+
+def _eligibility_stage(chunks: Iterator[Chunk], candidates: list) -> Iterator[Chunk]:
+    for chunk in chunks:
+        for patient in chunk:
+            patient["eligibleDrugs"] = suitable_drugs_for(
+                candidates, patient.pop("conditions"), patient.pop("adverseDrugs")
+            )
+        yield chunk
+
+
+def _score_stage(chunks: Iterator[Chunk], workers: int) -> Iterator[Chunk]:
+    if workers <= 1:
+        for chunk in chunks:
+            yield _score_chunk(chunk)
+        return
+
+    # spawn thay vì fork: tiến trình server có nhiều luồng (job worker, uvicorn).
+    # Tiến trình con chỉ import app.cohort_scoring, không nạp ontology hay CSDL
+    pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+    try:
+        pending = deque()
+        for chunk in chunks:
+            pending.append(pool.submit(_score_chunk, chunk))
+            # Giới hạn số khối đang xử lý để bộ nhớ không tăng theo kích thước cohort
+            if len(pending) >= workers * 2:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+    finally:
+        pool.shutdown(wait=True, cancel_futures=True)
+
+
+def _emit_stage(chunks: Iterator[Chunk]) -> Iterator[Dict[str, Any]]:
+    for chunk in chunks:
+        for patient in chunk:
+            yield {field: patient[field] for field in COHORT_REVIEW_FIELDS}
+
+
+def _run_pipeline(
+    conn: sqlite3.Connection,
+    snapshot_path: str,
+    candidates: list,
+    chunk_size: int,
+    workers: int
+) -> Iterator[Dict[str, Any]]:
+    try:
+        chunks = _load_stage(conn, chunk_size)
+        chunks = _eligibility_stage(chunks, candidates)
+        chunks = _score_stage(chunks, workers)
+        yield from _emit_stage(chunks)
+    finally:
+        conn.close()
+        os.remove(snapshot_path)
+
+
+def review_cohort_logic(chunk_size: int = COHORT_CHUNK_SIZE, workers: int = 1) -> Iterator[Dict[str, Any]]:
+    # Chụp CSDL ngay khi gọi (không đợi lần lặp đầu) để lỗi được báo trước khi stream
+    chunk_size = max(1, min(chunk_size, COHORT_MAX_CHUNK_SIZE))
+    workers = max(1, min(workers, COHORT_MAX_WORKERS))
+
+    try:
+        conn, snapshot_path = open_cohort_snapshot()
+    except sqlite3.Error as e:
+        print(f"Database error: {e}")
+        raise Exception(f"Database error: {e}")
+    candidates = capture_drug_disadvantages()
+
+    return _run_pipeline(conn, snapshot_path, candidates, chunk_size, workers)
+
+
+def encode_ndjson(rows: Iterator[Dict[str, Any]]) -> Iterator[bytes]:
+    for row in rows:
+        yield (json.dumps(row, ensure_ascii=False, separators=(",", ":")) + "\n").encode("utf-8")
+
+
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(description="Stream the cohort review (one JSON object per patient).")
+    parser.add_argument("-o", "--output", help="output file (default: stdout)")
+    parser.add_argument("--chunk-size", type=int, default=COHORT_CHUNK_SIZE)
+    parser.add_argument("--workers", type=int, default=1, help="processes for the rank/target stages")
+    args = parser.parse_args(argv)
+
+    out = open(args.output, "wb") if args.output else sys.stdout.buffer
+    count = 0
+    try:
+        for line in encode_ndjson(review_cohort_logic(args.chunk_size, args.workers)):
+            out.write(line)
+            count += 1
+    finally:
+        if args.output:
+            out.close()
+
+    print(f"{count} patients reviewed", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
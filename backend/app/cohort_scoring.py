@@ -0,0 +1,35 @@
+# Các bước tính toán thuần của cohort review, chạy trong tiến trình con (spawn).
+# Chỉ import topsis và fuzzy_logic để tiến trình con khởi động nhanh: không nạp
+# ontology, không mở CSDL
+from typing import Any, Dict, List
+
+from app.fuzzy_logic import calculate_hba1c_target_from_codes
+from app.topsis import rank_drugs
+
+Chunk = List[Dict[str, Any]]
+
+
+def _rank_stage(chunk: Chunk) -> Chunk:
+    for patient in chunk:
+        patient["rankedDrugs"] = rank_drugs(patient["eligibleDrugs"], patient["history"])
+    return chunk
+
+
+def _target_stage(chunk: Chunk) -> Chunk:
+    for patient in chunk:
+        target = None
+        if patient["diabetesCodes"] is not None:
+            hypoglycemia, duration, life, comorbidities, vascular, attitude, resources = patient["diabetesCodes"]
+            target = calculate_hba1c_target_from_codes(
+                hypoglycemia, duration, life, comorbidities, vascular, attitude, resources
+            )
+        patient["hba1cTarget"] = target
+        patient["hba1cGap"] = (
+            round(patient["hba1c"] - target, 2)
+            if target is not None and patient["hba1c"] is not None else None
+        )
+    return chunk
+
+
+def _score_chunk(chunk: Chunk) -> Chunk:
+    return _target_stage(_rank_stage(chunk))
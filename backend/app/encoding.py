@@ -0,0 +1,140 @@
+import json
+import struct
+from array import array
+from typing import Any, List, Optional, Sequence
+
+from fastapi import Response
+
+try:
+    import msgpack
+except ImportError:  # msgpack là tùy chọn
+    msgpack = None
+
+JSON_MEDIA_TYPE = "application/json"
+COLUMNAR_JSON_MEDIA_TYPE = "application/vnd.diabetes.columnar+json"
+MSGPACK_MEDIA_TYPE = "application/msgpack"
+COLUMNAR_BINARY_MEDIA_TYPE = "application/vnd.diabetes.columnar"
+
+# Định dạng nhị phân dạng cột (little-endian, mọi khối căn lề 8 byte để client
+# có thể tạo TypedArray trực tiếp trên buffer mà không cần sao chép):
+#   header (16 byte): magic "DICB", version u8, 3 byte đệm, số cột u32, số dòng u32
+#   mỗi cột: độ dài tên u32, kiểu u8 ('i' int64, 'd' float64, 's' utf-8), 3 byte đệm,
+#            tên utf-8, bitmap giá trị hợp lệ (1 bit/dòng), rồi dữ liệu:
+#            'i'/'d': n giá trị 8 byte; 's': n+1 offset int32 rồi các byte utf-8
+BINARY_MAGIC = b"DICB"
+BINARY_VERSION = 1
+
+
+def _supported_media_types() -> List[str]:
+    media_types = [JSON_MEDIA_TYPE, COLUMNAR_JSON_MEDIA_TYPE, COLUMNAR_BINARY_MEDIA_TYPE]
+    if msgpack is not None:
+        media_types.append(MSGPACK_MEDIA_TYPE)
+    return media_types
+
+
+def negotiate_media_type(accept: Optional[str]) -> str:
+    # Chọn định dạng có q cao nhất mà server hỗ trợ, mặc định là JSON
+    if not accept:
+        return JSON_MEDIA_TYPE
+
+    supported = _supported_media_types()
+    best, best_q = JSON_MEDIA_TYPE, -1.0
+    for part in accept.split(","):
+        media_type, *params = [piece.strip() for piece in part.split(";")]
+        q = 1.0
+        for param in params:
+            if param.startswith("q="):
+                try:
+                    q = float(param[2:])
+                except ValueError:
+                    q = 0.0
+        if media_type in ("*/*", "application/*"):
+            media_type = JSON_MEDIA_TYPE
+        if media_type in supported and q > best_q and q > 0:
+            best, best_q = media_type, q
+    return best
+
+
+def _columns_of(rows: Sequence[tuple], width: int) -> List[tuple]:
+    return list(zip(*rows)) if rows else [() for _ in range(width)]
+
+
+def _pad(buffer: bytearray) -> None:
+    buffer.extend(b"\0" * (-len(buffer) % 8))
+
+
+def _column_type(values: tuple) -> str:
+    column_type = "i"
+    for value in values:
+        if value is None:
+            continue
+        if isinstance(value, float):
+            column_type = "d"
+        elif not isinstance(value, int):
+            return "s"
+    return column_type
+
+
+def encode_columnar_binary(columns: List[str], rows: Sequence[tuple]) -> bytes:
+    buffer = bytearray()
+    buffer.extend(struct.pack("<4sB3xII", BINARY_MAGIC, BINARY_VERSION, len(columns), len(rows)))
+
+    for name, values in zip(columns, _columns_of(rows, len(columns))):
+        column_type = _column_type(values)
+        encoded_name = name.encode("utf-8")
+        buffer.extend(struct.pack("<IB3x", len(encoded_name), ord(column_type)))
+        buffer.extend(encoded_name)
+        _pad(buffer)
+
+        validity = bytearray((len(values) + 7) // 8)
+        for index, value in enumerate(values):
+            if value is not None:
+                validity[index >> 3] |= 1 << (index & 7)
+        buffer.extend(validity)
+        _pad(buffer)
+
+        if column_type == "s":
+            offsets = array("i", [0])
+            data = bytearray()
+            for value in values:
+                if value is not None:
+                    data.extend(str(value).encode("utf-8"))
+                offsets.append(len(data))
+            buffer.extend(offsets.tobytes())
+            _pad(buffer)
+            buffer.extend(data)
+        else:
+            typecode = "q" if column_type == "i" else "d"
+            default = 0 if column_type == "i" else 0.0
+            buffer.extend(array(typecode, [default if v is None else v for v in values]).tobytes())
+        _pad(buffer)
+
+    return bytes(buffer)
+
+
+def encode_table(columns: List[str], rows: Sequence[tuple], accept: Optional[str]) -> Response:
+    # Trả về Response trực tiếp để FastAPI bỏ qua bước validate/encode từng trường
+    media_type = negotiate_media_type(accept)
+
+    if media_type == COLUMNAR_BINARY_MEDIA_TYPE:
+        body = encode_columnar_binary(columns, rows)
+    elif media_type in (COLUMNAR_JSON_MEDIA_TYPE, MSGPACK_MEDIA_TYPE):
+        table: Any = {
+            "length": len(rows),
+            "columns": {
+                name: list(values)
+                for name, values in zip(columns, _columns_of(rows, len(columns)))
+            }
+        }
+        if media_type == MSGPACK_MEDIA_TYPE:
+            body = msgpack.packb(table)
+        else:
+            body = json.dumps(table, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    else:
+        body = json.dumps(
+            [dict(zip(columns, row)) for row in rows],
+            ensure_ascii=False,
+            separators=(",", ":")
+        ).encode("utf-8")
+
+    return Response(content=body, media_type=media_type, headers={"Vary": "Accept"})
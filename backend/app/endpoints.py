@@ -1,4 +1,6 @@
-from fastapi import APIRouter, Query, HTTPException, Form, UploadFile, File
+from typing import Optional
+from fastapi import APIRouter, Query, Path, HTTPException, Header, Form, UploadFile, File, Request, Response
+from fastapi.responses import FileResponse, StreamingResponse
 from app.logic import (
     get_all_patients_logic, 
     add_patient_logic,
@@ -9,6 +11,24 @@ from app.logic import (
     update_patient_history_logic
 )
 from app.sparql_utils import get_suitable_drugs
+from app.search import search_patients_logic, typeahead_patients_logic
+from app.recommendations import get_recommendation_logic, schedule_recompute_all_recommendations
+from app.jobs import get_job_logic
+from app.cohort_review import (
+    review_cohort_logic,
+    encode_ndjson,
+    COHORT_CHUNK_SIZE,
+    COHORT_MAX_REQUEST_WORKERS,
+    NDJSON_MEDIA_TYPE
+)
+from app.encoding import encode_table
+from app.avatars import (
+    save_avatar_logic,
+    get_avatar_file,
+    get_avatar_thumbnail,
+    IMMUTABLE_CACHE_CONTROL,
+    THUMBNAIL_SIZES
+)
 from app.schemas import PatientData, t2dmData, HbA1cUpdateData, PatientHistoryData
 
 router = APIRouter()
@@ -18,9 +38,35 @@ def root():
     return {"message": "API running"}
 
 @router.get("/patients/all") # Done
-def get_all_patients():
+def get_all_patients(accept: Optional[str] = Header(None)):
+    try:
+        columns, rows = get_all_patients_logic()
+        return encode_table(columns, rows, accept)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.get("/patients/search")
+def search_patients(
+    q: str = Query(..., min_length=1),
+    limit: int = Query(50, ge=1, le=200),
+    offset: int = Query(0, ge=0),
+    accept: Optional[str] = Header(None)
+):
+    try:
+        columns, rows = search_patients_logic(q, limit, offset)
+        return encode_table(columns, rows, accept)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.get("/patients/typeahead")
+def typeahead_patients(
+    q: str = Query(..., min_length=1),
+    limit: int = Query(10, ge=1, le=50),
+    accept: Optional[str] = Header(None)
+):
     try:
-        return get_all_patients_logic()
+        columns, rows = typeahead_patients_logic(q, limit)
+        return encode_table(columns, rows, accept)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -83,4 +129,90 @@ def suitable_drugs(patient_id: int):
         drugs = get_suitable_drugs(patient_id)
         return {"suitable_drugs": drugs}
     except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.get("/patients/{patient_id}/recommendation")
+def patient_recommendation(patient_id: int):
+    try:
+        recommendation = get_recommendation_logic(patient_id)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    if recommendation is None:
+        raise HTTPException(status_code=404, detail="Recommendation not found")
+    return recommendation
+
+@router.post("/jobs/recommendations/recompute")
+def recompute_recommendations():
+    try:
+        job_id = schedule_recompute_all_recommendations()
+        return {"job_id": job_id}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.get("/cohort/review")
+def cohort_review(
+    chunk_size: int = Query(COHORT_CHUNK_SIZE, ge=1),
+    workers: int = Query(1, ge=1, le=COHORT_MAX_REQUEST_WORKERS)
+):
+    # Mỗi dòng là một bệnh nhân, gửi ngay khi khối của nó xử lý xong
+    try:
+        rows = review_cohort_logic(chunk_size, workers)
+        return StreamingResponse(encode_ndjson(rows), media_type=NDJSON_MEDIA_TYPE)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.get("/jobs/{job_id}")
+def get_job(job_id: int):
+    try:
+        job = get_job_logic(job_id)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+@router.post("/patients/{patient_id}/avatar")
+async def upload_avatar(patient_id: int, request: Request):
+    # Thân request là nội dung ảnh thô (Content-Type: image/*), không dùng multipart
+    try:
+        return await save_avatar_logic(patient_id, request.stream())
+    except LookupError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+def immutable_file_response(path: str, media_type: str, etag: str, if_none_match: Optional[str]):
+    headers = {"Cache-Control": IMMUTABLE_CACHE_CONTROL, "ETag": etag}
+    if if_none_match and (if_none_match.strip() == "*" or etag in [t.strip() for t in if_none_match.split(",")]):
+        return Response(status_code=304, headers=headers)
+    return FileResponse(path, media_type=media_type, headers=headers)
+
+@router.get("/avatars/{sha256}")
+def get_avatar(
+    sha256: str = Path(..., pattern="^[0-9a-f]{64}$"),
+    if_none_match: Optional[str] = Header(None)
+):
+    avatar = get_avatar_file(sha256)
+    if avatar is None:
+        raise HTTPException(status_code=404, detail="Avatar not found")
+    path, media_type = avatar
+    return immutable_file_response(path, media_type, f'"{sha256}"', if_none_match)
+
+@router.get("/avatars/{sha256}/thumb/{size}")
+def get_avatar_thumb(
+    size: int,
+    sha256: str = Path(..., pattern="^[0-9a-f]{64}$"),
+    if_none_match: Optional[str] = Header(None)
+):
+    if size not in THUMBNAIL_SIZES:
+        raise HTTPException(status_code=404, detail="Thumbnail size not available")
+    try:
+        thumbnail = get_avatar_thumbnail(sha256, size)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    if thumbnail is None:
+        raise HTTPException(status_code=404, detail="Avatar not found")
+    path, media_type = thumbnail
+    return immutable_file_response(path, media_type, f'"{sha256}-{size}"', if_none_match)
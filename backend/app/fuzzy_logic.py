@@ -0,0 +1,204 @@
+import math
+from typing import Dict, List, Optional, Callable
+
+# Nhãn ngôn ngữ theo mã lưu trong bảng diabete (chỉ số = mã)
+HYPOGLYCEMIA_LEVELS = ["Low", "Low-Medium", "Medium", "Medium-High", "High"]
+LIFE_EXPECTANCY_LEVELS = ["Very Long", "Long", "Moderate", "Limited", "Short"]
+COMORBIDITIES_LEVELS = ["Absent", "Minimal", "Mild", "Moderate", "Severe"]
+VASCULAR_COMPLICATIONS_LEVELS = ["None", "Minimal", "Mild", "Moderate", "Severe"]
+PATIENT_ATTITUDE_LEVELS = [
+    "Highly motivated", "Very motivated", "Moderately motivated",
+    "Somewhat motivated", "Less motivated"
+]
+RESOURCES_SUPPORT_LEVELS = ["Readily available", "Available", "Moderate", "Restricted", "Limited"]
+
+
+def _low(x: float) -> float:
+    return 1 if x <= 0.5 else -0.5 * x + 1.25 if x <= 2.5 else 0
+
+
+def _high(x: float) -> float:
+    return 0 if x <= 1.5 else 0.5 * x - 0.75 if x <= 3.5 else 1
+
+
+def _absent(x: float) -> float:
+    return 1 if x <= 0.5 else (-2 / 3) * x + 4 / 3 if x <= 2.0 else 0
+
+
+def _few_or_mild(x: float) -> float:
+    if x <= 0.5:
+        return 0
+    if x <= 2.0:
+        return (2 / 3) * x - 1 / 3
+    if x <= 3.5:
+        return (-2 / 3) * x + 7 / 3
+    return 0
+
+
+def _severe(x: float) -> float:
+    return 0 if x <= 2.0 else (2 / 3) * x - 4 / 3 if x <= 3.5 else 1
+
+
+# Tập mờ đầu vào (thang 0-4), giống utils/fuzzyLogic.ts ở frontend
+INPUT_FUZZY_SETS: Dict[str, Dict[str, Callable[[float], float]]] = {
+    "hypoglycemiaRisk": {"Low": _low, "High": _high},
+    "diseaseDuration": {"Newly-Diagnosed": _low, "Long-Standing": _high},
+    "lifeExpectancy": {"Long": _low, "Short": _high},
+    "comorbidities": {"Absent": _absent, "Few-Or-Mild": _few_or_mild, "Severe": _severe},
+    "vascularComplications": {"Absent": _absent, "Few-Or-Mild": _few_or_mild, "Severe": _severe},
+    "patientAttitude": {"Highly-Motivated": _low, "Less-Motivated": _high},
+    "resourcesSupport": {"Readily-Available": _low, "Limited": _high},
+}
+
+
+def _mild_stringent(x: float) -> float:
+    if x <= 6.5:
+        return 0
+    if x <= 7.7:
+        return (5 / 6.0) * x - 65 / 12.0
+    if x <= 9.0:
+        return (-10 / 13.0) * x + 90 / 13.0
+    return 0
+
+
+OUTPUT_FUZZY_SETS: Dict[str, Callable[[float], float]] = {
+    "More-Stringent": lambda x: 1 if x <= 6.5 else -x + 7.5 if x <= 7.5 else 0,
+    "Mild-Stringent": _mild_stringent,
+    "Less-Stringent": lambda x: 0 if x <= 8.0 else x - 8.0 if x <= 9.0 else 1,
+}
+
+OUTPUT_SET_CENTERS = {
+    "More-Stringent": 6.5,
+    "Mild-Stringent": 7.7,
+    "Less-Stringent": 9.0,
+}
+
+# (đầu vào, đầu ra, trọng số) cho các luật R1-R13
+FUZZY_RULES = [
+    ({"hypoglycemiaRisk": "High"}, "Less-Stringent", 0.9),
+    ({"diseaseDuration": "Long-Standing"}, "Less-Stringent", 0.8),
+    ({"lifeExpectancy": "Short"}, "Less-Stringent", 0.9),
+    ({"comorbidities": "Severe"}, "Less-Stringent", 0.8),
+    ({"vascularComplications": "Severe"}, "Less-Stringent", 0.8),
+    ({"diseaseDuration": "Newly-Diagnosed"}, "More-Stringent", 0.8),
+    ({"lifeExpectancy": "Long"}, "More-Stringent", 0.8),
+    ({"patientAttitude": "Highly-Motivated"}, "More-Stringent", 0.9),
+    ({"resourcesSupport": "Readily-Available"}, "More-Stringent", 0.7),
+    (
+        {"hypoglycemiaRisk": "Low", "comorbidities": "Absent", "vascularComplications": "Absent"},
+        "More-Stringent",
+        0.9
+    ),
+    ({"comorbidities": "Few-Or-Mild"}, "Mild-Stringent", 0.7),
+    ({"vascularComplications": "Few-Or-Mild"}, "Mild-Stringent", 0.7),
+    ({"comorbidities": "Few-Or-Mild", "vascularComplications": "Few-Or-Mild"}, "Less-Stringent", 0.8),
+]
+
+DEFAULT_HBA1C_TARGET = 6.5
+
+
+def _level(levels: List[str], code: Optional[int]) -> str:
+    if code is None or not 0 <= code < len(levels):
+        return ""
+    return levels[code]
+
+
+def map_language_to_numeric(
+    hypoglycemia_risk: str,
+    disease_duration: float,
+    life_expectancy: str,
+    comorbidities: str,
+    vascular_complications: str,
+    patient_attitude: str,
+    resources_support: str
+) -> Dict[str, float]:
+    if disease_duration <= 5:
+        duration_value = 0
+    elif disease_duration >= 10:
+        duration_value = 4
+    else:
+        duration_value = 2
+
+    return {
+        "hypoglycemiaRisk": {"Low": 0, "High": 4}.get(hypoglycemia_risk, 2),
+        "diseaseDuration": duration_value,
+        "lifeExpectancy": {"Long": 0, "Short": 4}.get(life_expectancy, 2),
+        "comorbidities": {"Absent": 0, "Few-Or-Mild": 2, "Severe": 4}.get(comorbidities, 2),
+        "vascularComplications": {"None": 0, "Few-Or-Mild": 2, "Severe": 4}.get(vascular_complications, 2),
+        "patientAttitude": {"Highly-Motivated": 0, "Less-Motivated": 4}.get(patient_attitude, 2),
+        "resourcesSupport": {"Readily-Available": 0, "Limited": 4}.get(resources_support, 2),
+    }
+
+
+def calculate_hba1c_target(
+    hypoglycemia_risk: str,
+    disease_duration: float,
+    life_expectancy: str,
+    comorbidities: str,
+    vascular_complications: str,
+    patient_attitude: str,
+    resources_support: str = "Moderate"
+) -> float:
+    crisp_inputs = map_language_to_numeric(
+        hypoglycemia_risk,
+        disease_duration,
+        life_expectancy,
+        comorbidities,
+        vascular_complications,
+        patient_attitude,
+        resources_support
+    )
+
+    # Bước 1: mờ hóa
+    fuzzified = {
+        name: {set_name: mf(crisp_inputs[name]) for set_name, mf in sets.items()}
+        for name, sets in INPUT_FUZZY_SETS.items()
+    }
+
+    # Bước 2: kích hoạt luật (MIN cho AND, nhân trọng số)
+    activations = []
+    for inputs, output, weight in FUZZY_RULES:
+        level = min(fuzzified[name][set_name] for name, set_name in inputs.items())
+        if level > 0:
+            activations.append((output, level * weight))
+
+    if not activations:
+        return DEFAULT_HBA1C_TARGET
+
+    # Bước 3: tổng hợp MAX trên lưới 6.5 -> 9.0, bước 0.1
+    x_values = [6.5 + i * 0.1 for i in range(26)]
+    max_membership = dict.fromkeys(OUTPUT_SET_CENTERS, 0.0)
+    for output, activation in activations:
+        mf = OUTPUT_FUZZY_SETS[output]
+        peak = max(min(mf(x), activation) for x in x_values)
+        max_membership[output] = max(max_membership[output], peak)
+
+    # Bước 4: khử mờ bằng trung bình có trọng số của tâm các tập
+    weighted_sum = sum(OUTPUT_SET_CENTERS[name] * m for name, m in max_membership.items() if m > 0)
+    weight_sum = sum(m for m in max_membership.values() if m > 0)
+    if weight_sum == 0:
+        return DEFAULT_HBA1C_TARGET
+
+    # Làm tròn 1 chữ số thập phân giống Math.round
+    return math.floor(weighted_sum / weight_sum * 10 + 0.5) / 10
+
+
+def calculate_hba1c_target_from_codes(
+    hypoglycemia: Optional[int],
+    disease_duration: Optional[int],
+    life_expectancy: Optional[int],
+    comorbidities: Optional[int],
+    vascular_complications: Optional[int],
+    attitude: Optional[int],
+    resources: Optional[int]
+) -> float:
+    # Nhận mã số như lưu trong bảng diabete
+    return calculate_hba1c_target(
+        _level(HYPOGLYCEMIA_LEVELS, hypoglycemia),
+        disease_duration or 0,
+        _level(LIFE_EXPECTANCY_LEVELS, life_expectancy),
+        _level(COMORBIDITIES_LEVELS, comorbidities),
+        _level(VASCULAR_COMPLICATIONS_LEVELS, vascular_complications),
+        _level(PATIENT_ATTITUDE_LEVELS, attitude),
+        _level(RESOURCES_SUPPORT_LEVELS, resources)
+    )
@@ -0,0 +1,296 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+CURRENT_DIR = os.path.dirname(os.path.abspath(__file__))
+DATABASE_PATH = os.path.abspath(os.path.join(CURRENT_DIR, "..", "diabetes.db"))
+
+PRIORITY_HIGH = 10
+PRIORITY_NORMAL = 0
+PRIORITY_LOW = -10
+
+JOB_WORKER_COUNT = 2
+JOB_POLL_INTERVAL = 5.0
+JOB_MAX_ATTEMPTS = 3
+JOB_RETRY_BACKOFF = 2.0
+JOB_RETENTION_SECONDS = 7 * 24 * 3600
+
+# status: queued -> running -> done | failed | merged (gộp vào job khác khi thử lại)
+JOB_SCHEMA = """
+CREATE TABLE IF NOT EXISTS job (
+    job_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    kind TEXT NOT NULL,
+    payload TEXT NOT NULL DEFAULT '{}',
+    coalesce_key TEXT,
+    priority INTEGER NOT NULL DEFAULT 0,
+    status TEXT NOT NULL DEFAULT 'queued',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    max_attempts INTEGER NOT NULL DEFAULT 3,
+    progress REAL NOT NULL DEFAULT 0,
+    message TEXT,
+    result TEXT,
+    error TEXT,
+    run_after REAL NOT NULL DEFAULT 0,
+    created_at REAL NOT NULL,
+    started_at REAL,
+    finished_at REAL
+);
+
+CREATE UNIQUE INDEX IF NOT EXISTS idx_job_coalesce
+    ON job (coalesce_key) WHERE status = 'queued';
+
+CREATE INDEX IF NOT EXISTS idx_job_queue
+    ON job (priority DESC, job_id) WHERE status = 'queued';
+"""
+
+JobHandler = Callable[[Dict[str, Any], Callable[[float, Optional[str]], None]], Any]
+
+_handlers: Dict[str, JobHandler] = {}
+_wakeup = threading.Event()
+
+
+def job_handler(kind: str) -> Callable[[JobHandler], JobHandler]:
+    # Đăng ký hàm xử lý: handler(payload, report_progress) -> result
+    def register(handler: JobHandler) -> JobHandler:
+        _handlers[kind] = handler
+        return handler
+    return register
+
+
+def ensure_job_schema(database_path: str = DATABASE_PATH) -> None:
+    conn = sqlite3.connect(database_path)
+    try:
+        cursor = conn.cursor()
+        cursor.executescript(JOB_SCHEMA)
+
+        # Job đang chạy khi tiến trình dừng đột ngột được đưa lại vào hàng đợi
+        cursor.execute(
+            """
+            UPDATE job SET status = 'merged', finished_at = ?
+            WHERE status = 'running' AND coalesce_key IN (
+                SELECT coalesce_key FROM job WHERE status = 'queued'
+            )
+            """,
+            (time.time(),)
+        )
+        # Nhiều job cùng coalesce_key có thể cùng đang chạy; chỉ đưa lại job mới nhất
+        # vào hàng đợi để không vi phạm chỉ mục unique trên các job queued
+        cursor.execute(
+            """
+            UPDATE job SET status = 'merged', finished_at = ?
+            WHERE status = 'running' AND coalesce_key IS NOT NULL AND job_id < (
+                SELECT max(j.job_id) FROM job j
+                WHERE j.status = 'running' AND j.coalesce_key = job.coalesce_key
+            )
+            """,
+            (time.time(),)
+        )
+        cursor.execute("UPDATE job SET status = 'queued' WHERE status = 'running'")
+
+        # Dọn các job đã xong quá thời gian lưu giữ
+        cursor.execute(
+            "DELETE FROM job WHERE status IN ('done', 'merged') AND finished_at < ?",
+            (time.time() - JOB_RETENTION_SECONDS,)
+        )
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def enqueue_job(
+    kind: str,
+    payload: Optional[Dict[str, Any]] = None,
+    coalesce_key: Optional[str] = None,
+    priority: int = PRIORITY_NORMAL,
+    max_attempts: int = JOB_MAX_ATTEMPTS
+) -> int:
+    # Job cùng coalesce_key đang chờ sẽ được gộp: trả về job cũ, giữ độ ưu tiên cao hơn
+    conn = sqlite3.connect(DATABASE_PATH)
+    try:
+        cursor = conn.cursor()
+        cursor.execute(
+            """
+            INSERT INTO job (kind, payload, coalesce_key, priority, max_attempts, created_at)
+            VALUES (?, ?, ?, ?, ?, ?)
+            ON CONFLICT (coalesce_key) WHERE status = 'queued' DO UPDATE SET
+                priority = max(priority, excluded.priority)
+            RETURNING job_id
+            """,
+            (kind, json.dumps(payload or {}), coalesce_key, priority, max_attempts, time.time())
+        )
+        job_id = cursor.fetchone()[0]
+        conn.commit()
+    finally:
+        conn.close()
+
+    _wakeup.set()
+    return job_id
+
+
+def get_job_logic(job_id: int) -> Optional[Dict[str, Any]]:
+    try:
+        conn = sqlite3.connect(DATABASE_PATH)
+        conn.row_factory = sqlite3.Row
+        cursor = conn.cursor()
+        cursor.execute("SELECT * FROM job WHERE job_id = ?", (job_id,))
+        row = cursor.fetchone()
+        conn.close()
+
+        if not row:
+            return None
+
+        return {
+            "id": row["job_id"],
+            "kind": row["kind"],
+            "status": row["status"],
+            "priority": row["priority"],
+            "attempts": row["attempts"],
+            "maxAttempts": row["max_attempts"],
+            "progress": row["progress"],
+            "message": row["message"],
+            "result": json.loads(row["result"]) if row["result"] else None,
+            "error": row["error"],
+            "createdAt": row["created_at"],
+            "startedAt": row["started_at"],
+            "finishedAt": row["finished_at"]
+        }
+
+    except sqlite3.Error as e:
+        print(f"Database error: {e}")
+        raise Exception(f"Database error: {e}")
+
+
+def _claim_next_job(conn: sqlite3.Connection) -> Optional[tuple]:
+    cursor = conn.cursor()
+    now = time.time()
+    cursor.execute(
+        """
+        UPDATE job SET
+            status = 'running',
+            attempts = attempts + 1,
+            started_at = ?,
+            error = NULL
+        WHERE job_id = (
+            SELECT job_id FROM job
+            WHERE status = 'queued' AND run_after <= ?
+            ORDER BY priority DESC, job_id
+            LIMIT 1
+        )
+        RETURNING job_id, kind, payload, attempts, max_attempts
+        """,
+        (now, now)
+    )
+    row = cursor.fetchone()
+    conn.commit()
+    return row
+
+
+def _report_progress(conn: sqlite3.Connection, job_id: int) -> Callable[[float, Optional[str]], None]:
+    def report(progress: float, message: Optional[str] = None) -> None:
+        conn.execute(
+            "UPDATE job SET progress = ?, message = coalesce(?, message) WHERE job_id = ?",
+            (max(0.0, min(1.0, progress)), message, job_id)
+        )
+        conn.commit()
+    return report
+
+
+def _finish_job(conn: sqlite3.Connection, job_id: int, result: Any) -> None:
+    conn.execute(
+        """
+        UPDATE job SET status = 'done', progress = 1, result = ?, finished_at = ?
+        WHERE job_id = ?
+        """,
+        (json.dumps(result), time.time(), job_id)
+    )
+    conn.commit()
+
+
+def _fail_job(conn: sqlite3.Connection, job_id: int, attempts: int, max_attempts: int, error: str) -> None:
+    now = time.time()
+    if attempts >= max_attempts:
+        conn.execute(
+            "UPDATE job SET status = 'failed', error = ?, finished_at = ? WHERE job_id = ?",
+            (error, now, job_id)
+        )
+        conn.commit()
+        return
+
+    try:
+        conn.execute(
+            "UPDATE job SET status = 'queued', error = ?, run_after = ? WHERE job_id = ?",
+            (error, now + JOB_RETRY_BACKOFF ** attempts, job_id)
+        )
+    except sqlite3.IntegrityError:
+        # Đã có job cùng coalesce_key đang chờ, job đó sẽ làm thay
+        conn.execute(
+            "UPDATE job SET status = 'merged', error = ?, finished_at = ? WHERE job_id = ?",
+            (error, now, job_id)
+        )
+    conn.commit()
+
+
+def run_next_job(conn: sqlite3.Connection) -> bool:
+    claimed = _claim_next_job(conn)
+    if claimed is None:
+        return False
+
+    job_id, kind, payload, attempts, max_attempts = claimed
+    handler = _handlers.get(kind)
+    if handler is None:
+        _fail_job(conn, job_id, max_attempts, max_attempts, f"Unknown job kind: {kind}")
+        return True
+
+    try:
+        result = handler(json.loads(payload), _report_progress(conn, job_id))
+        # Lưu kết quả cũng có thể lỗi (vd. kết quả không chuyển được sang JSON)
+        _finish_job(conn, job_id, result)
+    except Exception as e:
+        print(f"Error running job {job_id} ({kind}): {e}")
+        conn.rollback()
+        _fail_job(conn, job_id, attempts, max_attempts, str(e))
+    return True
+
+
+class JobWorkerPool:
+    def __init__(self, size: int = JOB_WORKER_COUNT, poll_interval: float = JOB_POLL_INTERVAL):
+        self.size = size
+        self.poll_interval = poll_interval
+        self._stop = threading.Event()
+        self._threads: List[threading.Thread] = []
+
+    def start(self) -> None:
+        self._stop.clear()
+        for index in range(self.size):
+            thread = threading.Thread(target=self._run, name=f"job-worker-{index}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self, timeout: float = 10.0) -> None:
+        self._stop.set()
+        _wakeup.set()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+
+    def _run(self) -> None:
+        conn = sqlite3.connect(DATABASE_PATH)
+        try:
+            while not self._stop.is_set():
+                _wakeup.clear()
+                try:
+                    ran = run_next_job(conn)
+                except Exception as e:
+                    # Không để một lỗi bất kỳ làm chết luồng worker
+                    print(f"Error in job worker: {e}")
+                    conn.rollback()
+                    ran = False
+
+                # Hết việc thì chờ job mới hoặc tới kỳ kiểm tra (job thử lại có run_after)
+                if not ran:
+                    _wakeup.wait(self.poll_interval)
+        finally:
+            conn.close()
@@ -2,16 +2,22 @@
 import sqlite3
 import os
 import uuid
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Tuple
 from datetime import datetime
 from app.schemas import PatientData, t2dmData
+from app.recommendations import (
+    mark_patient_dirty,
+    schedule_recommendation_refresh,
+    get_recommendation_logic
+)
+from app.jobs import enqueue_job
+from app.avatars import avatar_urls
+from app.sparql_utils import ontology_graph as g, ONTOLOGY_LOCK, FLUSH_ONTOLOGY_JOB, refresh_inferences
 
-from rdflib import Graph, Namespace, Literal, RDF
+from rdflib import Namespace, Literal, RDF
 from rdflib.namespace import XSD
 
 DATABASE_PATH = os.path.join(os.path.dirname(__file__), "../diabetes.db")
-g = Graph()
-g.parse("diabetes.rdf", format="xml")
 DIABETES = Namespace("http://www.semanticweb.org/admin/ontologies/2025/3/diabetes#")
 
 def add_patient_logic(data: PatientData) -> dict:
@@ -43,8 +49,10 @@ def add_patient_logic(data: PatientData) -> dict:
         individual_name = f"Patient{patient_id}"
         patient_uri = DIABETES[individual_name]
 
-        g.add((patient_uri, RDF.type, DIABETES.Patients))
-        g.serialize(destination="diabetes.rdf", format="pretty-xml")
+        with ONTOLOGY_LOCK:
+            g.add((patient_uri, RDF.type, DIABETES.Patients))
+            refresh_inferences([patient_uri])
+        enqueue_job(FLUSH_ONTOLOGY_JOB, coalesce_key=FLUSH_ONTOLOGY_JOB)
         
         cursor.execute(
             """
@@ -67,9 +75,11 @@ def add_patient_logic(data: PatientData) -> dict:
                 0
             )
         )
+        mark_patient_dirty(cursor, patient_id)
         
         conn.commit()
         conn.close()
+        schedule_recommendation_refresh()
         
         return {
             "message": "Patient added successfully",
@@ -92,51 +102,67 @@ def add_patient_logic(data: PatientData) -> dict:
         print(f"Error adding patient: {e}")
         raise Exception(f"Error adding patient: {e}")
 
-def get_all_patients_logic() -> List[Dict[str, Any]]:
+PATIENT_LIST_COLUMNS = [
+    "id",
+    "name",
+    "age",
+    "diabetesType",
+    "diseaseDuration",
+    "hba1cLevel",
+    "hypoglycemiaRisk",
+    "hba1cTarget",
+    "recommendedDrug",
+    "recommendationStale",
+    "avatarThumbnail"
+]
+
+# Dùng chung cho danh sách và tìm kiếm bệnh nhân; thứ tự cột trùng với
+# PATIENT_LIST_COLUMNS để dùng thẳng tuple từ cursor
+PATIENT_LIST_SELECT = """
+    SELECT 
+        p.patient_id, 
+        p.name, 
+        p.age, 
+        d.type_of_diabetes, 
+        d.disease_duration, 
+        d.hba1c, 
+        d.hypoglycemia,
+        r.hba1c_target,
+        json_extract(r.ranked_drugs, '$[0].drug'),
+        coalesce(r.dirty, 1),
+        '/api/avatars/' || a.sha256 || '/thumb/48'
+    FROM 
+        personal p
+    JOIN 
+        diabete d ON p.patient_id = d.patient_id
+    LEFT JOIN 
+        patient_recommendation r ON p.patient_id = r.patient_id
+    LEFT JOIN 
+        patient_avatar a ON p.patient_id = a.patient_id
+"""
+
+def patient_list_rows(rows: List[tuple]) -> List[tuple]:
+    # recommendationStale là boolean trong API; SQLite chỉ trả về 0/1
+    stale = PATIENT_LIST_COLUMNS.index("recommendationStale")
+    return [row[:stale] + (bool(row[stale]),) + row[stale + 1:] for row in rows]
+
+def get_all_patients_logic() -> Tuple[List[str], List[tuple]]:
     try:
         # Kết nối đến database
         conn = sqlite3.connect(DATABASE_PATH)
-        conn.row_factory = sqlite3.Row  
         cursor = conn.cursor()
         
-        query = """
-        SELECT 
-            p.patient_id, 
-            p.name, 
-            p.age, 
-            d.type_of_diabetes, 
-            d.disease_duration, 
-            d.hba1c, 
-            d.hypoglycemia
-        FROM 
-            personal p
-        JOIN 
-            diabete d ON p.patient_id = d.patient_id
+        query = f"""
+        {PATIENT_LIST_SELECT}
         ORDER BY 
-            p.name
+            p.patient_id
         """
         
         cursor.execute(query)
-        rows = cursor.fetchall()
-        
-        # Chuyển đổi kết quả thành danh sách các dictionary
-        patients = []
-        for row in rows:
-                
-            patient = {
-                "id": row["patient_id"],
-                "name": row["name"],
-                "age": row["age"],
-                "diabetesType": row["type_of_diabetes"],
-                "diseaseDuration": row["disease_duration"],
-                "hba1cLevel": row["hba1c"],
-                "hypoglycemiaRisk": row["hypoglycemia"]
-            }
-            patients.append(patient)
+        rows = patient_list_rows(cursor.fetchall())
         
         conn.close()
-        sorted_patients = sorted(patients, key=lambda x: x["id"])
-        return sorted_patients
+        return PATIENT_LIST_COLUMNS, rows
         
     except sqlite3.Error as e:
         # Log lỗi
@@ -158,11 +184,13 @@ def get_patient_logic(patient_id: int):
         cursor.execute(
             """
             SELECT 
-                name, age, gender, phone, email, address
+                p.name, p.age, p.gender, p.phone, p.email, p.address, a.sha256 AS avatar
             FROM 
-                personal 
+                personal p
+            LEFT JOIN 
+                patient_avatar a ON p.patient_id = a.patient_id
             WHERE 
-                patient_id = ?
+                p.patient_id = ?
             """, 
             (patient_id,)
         )
@@ -180,7 +208,8 @@ def get_patient_logic(patient_id: int):
             "gender": person_row["gender"],
             "phoneNumber": person_row["phone"],
             "email": person_row["email"],
-            "address": person_row["address"]
+            "address": person_row["address"],
+            "avatar": avatar_urls(person_row["avatar"]) if person_row["avatar"] else None
         }
         
         # 2. Lấy thông tin bệnh tiểu đường từ bảng diabete
@@ -278,7 +307,8 @@ def get_patient_logic(patient_id: int):
             "personal": personal_info,
             "diabetes": diabetes_info,
             "adverseReactions": adverse_reactions,
-            "medicalHistory": medical_history
+            "medicalHistory": medical_history,
+            "recommendation": get_recommendation_logic(patient_id)
         }
         
         return patient_data
@@ -352,9 +382,11 @@ def update_t2dm_logic(data: t2dmData) -> dict:
                 resources_support_map.get(data.resourcesSupport, 2)
             )
         )
+        mark_patient_dirty(cursor, data.id)
         
         conn.commit()
         conn.close()
+        schedule_recommendation_refresh()
         
         return {
             "message": "T2DM data updated successfully",
@@ -420,9 +452,11 @@ def update_hba1c_logic(patient_id: int, hba1c_level: float) -> dict:
                     0   # Resources mặc định
                 )
             )
+        mark_patient_dirty(cursor, patient_id)
         
         conn.commit()
         conn.close()
+        schedule_recommendation_refresh()
         
         return {
             "message": "HbA1c updated successfully",
@@ -594,25 +628,39 @@ def update_patient_history_logic(patient_id: int, history_data: dict) -> dict:
         # xử lý ontology
         patient_uri = DIABETES[f"Patient{patient_id}"]
 
-        for s, p, o in list(g.triples((patient_uri, DIABETES.has_History_of_Diseases, None))):
-            g.remove((s, p, o))
+        with ONTOLOGY_LOCK:
+            # Bệnh nhân và đối tượng của cạnh cũ/mới cần được suy diễn lại
+            touched = {patient_uri} | set(g.objects(patient_uri))
 
-        for s, p, o in list(g.triples((patient_uri, DIABETES.has_Adverse_Drug_Reactions, None))):
-            g.remove((s, p, o))
+            for s, p, o in list(g.triples((patient_uri, DIABETES.has_History_of_Diseases, None))):
+                g.remove((s, p, o))
 
-        for category in medical_categories:
-            if category in history_data and isinstance(history_data[category], list):
-                for condition in history_data[category]:
-                    condition_uri = DIABETES[condition.replace(" ", "_")]
-                    g.add((patient_uri, DIABETES.has_History_of_Diseases, condition_uri))
+            for s, p, o in list(g.triples((patient_uri, DIABETES.has_Adverse_Drug_Reactions, None))):
+                g.remove((s, p, o))
 
-        if "adrs" in history_data and isinstance(history_data["adrs"], list):
-            for drug in history_data["adrs"]:
-                drug_uri = DIABETES[drug.replace(" ", "_")]
-                g.add((patient_uri, DIABETES.has_Adverse_Drug_Reactions, drug_uri))
+            for category in medical_categories:
+                if category in history_data and isinstance(history_data[category], list):
+                    for condition in history_data[category]:
+                        condition_uri = DIABETES[condition.replace(" ", "_")]
+                        g.add((patient_uri, DIABETES.has_History_of_Diseases, condition_uri))
+
+            if "adrs" in history_data and isinstance(history_data["adrs"], list):
+                for drug in history_data["adrs"]:
+                    drug_uri = DIABETES[drug.replace(" ", "_")]
+                    g.add((patient_uri, DIABETES.has_Adverse_Drug_Reactions, drug_uri))
+
+            touched |= set(g.objects(patient_uri))
+            refresh_inferences(touched)
 
-        # Lưu lại ontology
-        g.serialize(destination="diabetes.rdf", format="pretty-xml")
+        # Lưu lại ontology ở nền, nhiều lần ghi liên tiếp được gộp thành một
+        enqueue_job(FLUSH_ONTOLOGY_JOB, coalesce_key=FLUSH_ONTOLOGY_JOB)
+
+        # Đánh dấu cần tính lại khuyến nghị sau khi ontology đã được cập nhật
+        conn = sqlite3.connect(DATABASE_PATH)
+        mark_patient_dirty(conn.cursor(), patient_id)
+        conn.commit()
+        conn.close()
+        schedule_recommendation_refresh()
         
         return {
             "message": "Patient history updated successfully",
@@ -1,10 +1,37 @@
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
 import os
 from app.endpoints import router as api_router
+from app.search import ensure_search_index
+from app.jobs import ensure_job_schema, JobWorkerPool
+from app.recommendations import ensure_recommendation_schema, schedule_recommendation_refresh
+from app.sparql_utils import flush_ontology
+from app.avatars import ensure_avatar_storage, AVATAR_THUMBNAIL_DIR
 
-app = FastAPI(title="Diabetes Advisor API")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Tạo chỉ mục tìm kiếm bệnh nhân (và trigger đồng bộ) nếu chưa có
+    ensure_search_index()
+    ensure_avatar_storage()
+
+    # Hàng đợi job nền cho các tác vụ nặng (ghi ontology, tính lại khuyến nghị...)
+    ensure_job_schema()
+    ensure_recommendation_schema()
+    job_pool = JobWorkerPool()
+    job_pool.start()
+
+    # Tính các khuyến nghị còn dirty từ lần chạy trước
+    schedule_recommendation_refresh()
+
+    yield
+
+    job_pool.stop()
+    # Ghi ontology trong bộ nhớ ra đĩa trước khi tắt
+    flush_ontology()
+
+app = FastAPI(title="Diabetes Advisor API", lifespan=lifespan)
 
 STATIC_DIR = os.path.join(os.path.dirname(__file__), "../static")
 
@@ -17,6 +44,7 @@ app.add_middleware(
 )
 
 # Mount thư mục static để phục vụ tệp tĩnh như avatar
+os.makedirs(AVATAR_THUMBNAIL_DIR, exist_ok=True)
 app.mount("/static", StaticFiles(directory=STATIC_DIR), name="static")
 
 app.include_router(api_router, prefix="/api", tags=["api"])
\ No newline at end of file
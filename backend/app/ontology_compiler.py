@@ -0,0 +1,284 @@
+import hashlib
+import os
+import tempfile
+from collections import defaultdict
+from typing import Dict, Iterable, Optional, Set, Tuple
+
+from rdflib import BNode, Graph, Literal, Namespace, RDF, RDFS, OWL, URIRef
+from rdflib.term import Node
+
+Triple = Tuple[Node, Node, Node]
+
+# Các vị từ thuộc phần schema (TBox); thay đổi bất kỳ triple nào dùng chúng
+# thì phải biên dịch lại bao đóng
+SCHEMA_PREDICATES = {
+    RDFS.subClassOf,
+    RDFS.subPropertyOf,
+    RDFS.domain,
+    RDFS.range,
+    OWL.equivalentClass,
+    OWL.onProperty,
+    OWL.someValuesFrom,
+}
+
+SCHEMA_TYPES = {
+    OWL.Class,
+    OWL.Restriction,
+    OWL.ObjectProperty,
+    OWL.DatatypeProperty,
+    RDF.Property,
+}
+
+# Restriction là blank node, nhãn đổi sau mỗi lần parse; đặt tên ổn định theo
+# (thuộc tính, lớp) để các triple suy diễn lưu ra tệp vẫn dùng lại được
+RESTRICTION = Namespace("urn:diabetes:restriction:")
+
+SCHEMA_FINGERPRINT_HEADER = "# schema-fingerprint "
+SOURCE_FINGERPRINT_HEADER = "# source-fingerprint "
+
+
+class CompiledSchema:
+    def __init__(self):
+        self.superclasses: Dict[Node, Set[Node]] = defaultdict(set)
+        self.superproperties: Dict[Node, Set[Node]] = defaultdict(set)
+        self.domains: Dict[Node, Set[Node]] = defaultdict(set)
+        self.ranges: Dict[Node, Set[Node]] = defaultdict(set)
+        # thuộc tính -> [(restriction, lớp someValuesFrom)]
+        self.some_values_from: Dict[Node, list] = defaultdict(list)
+
+    def closure_of(self, cls: Node) -> Set[Node]:
+        return {cls} | self.superclasses.get(cls, set())
+
+
+def _schema_triples(graph: Graph) -> Iterable[Triple]:
+    for predicate in SCHEMA_PREDICATES:
+        yield from graph.triples((None, predicate, None))
+    for schema_type in SCHEMA_TYPES:
+        yield from graph.triples((None, RDF.type, schema_type))
+
+
+def _local_name(node: Optional[Node]) -> str:
+    return str(node).split("#")[-1] if isinstance(node, URIRef) else "anon"
+
+
+def restriction_names(graph: Graph) -> Dict[Node, Node]:
+    names: Dict[Node, Node] = {}
+    for restriction in graph.subjects(RDF.type, OWL.Restriction):
+        if isinstance(restriction, BNode):
+            prop = graph.value(restriction, OWL.onProperty)
+            cls = graph.value(restriction, OWL.someValuesFrom)
+            names[restriction] = RESTRICTION[f"{_local_name(prop)}-some-{_local_name(cls)}"]
+    return names
+
+
+def schema_fingerprint(graph: Graph) -> str:
+    names = restriction_names(graph)
+
+    def term_key(term: Node) -> str:
+        term = names.get(term, term)
+        return "_:" if isinstance(term, BNode) else term.n3()
+
+    lines = sorted(" ".join(term_key(term) for term in triple) for triple in _schema_triples(graph))
+    return hashlib.sha256("\n".join(lines).encode("utf-8")).hexdigest()
+
+
+def source_fingerprint(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+def _transitive_closure(edges: Dict[Node, Set[Node]]) -> Dict[Node, Set[Node]]:
+    closure: Dict[Node, Set[Node]] = defaultdict(set)
+    for start in list(edges):
+        stack = list(edges[start])
+        seen = closure[start]
+        while stack:
+            node = stack.pop()
+            if node in seen or node == start:
+                continue
+            seen.add(node)
+            stack.extend(edges.get(node, ()))
+    return closure
+
+
+def compile_schema(graph: Graph) -> CompiledSchema:
+    names = restriction_names(graph)
+
+    def name(node: Node) -> Node:
+        return names.get(node, node)
+
+    schema = CompiledSchema()
+
+    class_edges: Dict[Node, Set[Node]] = defaultdict(set)
+    for sub, sup in graph.subject_objects(RDFS.subClassOf):
+        class_edges[name(sub)].add(name(sup))
+    for left, right in graph.subject_objects(OWL.equivalentClass):
+        class_edges[name(left)].add(name(right))
+        class_edges[name(right)].add(name(left))
+    schema.superclasses = _transitive_closure(class_edges)
+
+    property_edges: Dict[Node, Set[Node]] = defaultdict(set)
+    for sub, sup in graph.subject_objects(RDFS.subPropertyOf):
+        property_edges[sub].add(sup)
+    schema.superproperties = _transitive_closure(property_edges)
+
+    # Miền/phạm vi được kế thừa theo thuộc tính cha và mở rộng theo lớp cha
+    declared_domains: Dict[Node, Set[Node]] = defaultdict(set)
+    declared_ranges: Dict[Node, Set[Node]] = defaultdict(set)
+    for prop, cls in graph.subject_objects(RDFS.domain):
+        declared_domains[prop].add(name(cls))
+    for prop, cls in graph.subject_objects(RDFS.range):
+        declared_ranges[prop].add(name(cls))
+
+    for prop in set(declared_domains) | set(declared_ranges) | set(schema.superproperties):
+        for source in {prop} | schema.superproperties.get(prop, set()):
+            for cls in declared_domains.get(source, ()):
+                schema.domains[prop] |= schema.closure_of(cls)
+            for cls in declared_ranges.get(source, ()):
+                schema.ranges[prop] |= schema.closure_of(cls)
+
+    for restriction in graph.subjects(RDF.type, OWL.Restriction):
+        prop = graph.value(restriction, OWL.onProperty)
+        cls = graph.value(restriction, OWL.someValuesFrom)
+        if prop is not None and cls is not None:
+            schema.some_values_from[prop].append((name(restriction), name(cls)))
+
+    return schema
+
+
+def schema_closure_triples(schema: CompiledSchema) -> Set[Triple]:
+    triples = set()
+    for cls, supers in schema.superclasses.items():
+        for sup in supers:
+            triples.add((cls, RDFS.subClassOf, sup))
+    for prop, supers in schema.superproperties.items():
+        for sup in supers:
+            triples.add((prop, RDFS.subPropertyOf, sup))
+    return triples
+
+
+def _subject_triples(graph: Graph, schema: CompiledSchema, subject: Node, types: Dict[Node, Set[Node]]):
+    for predicate, obj in graph.predicate_objects(subject):
+        for prop in {predicate} | schema.superproperties.get(predicate, set()):
+            if prop != predicate:
+                yield (subject, prop, obj)
+
+            if prop == RDF.type:
+                for cls in schema.closure_of(obj):
+                    yield (subject, RDF.type, cls)
+                continue
+
+            for cls in schema.domains.get(prop, ()):
+                yield (subject, RDF.type, cls)
+
+            if isinstance(obj, Literal):
+                continue
+            for cls in schema.ranges.get(prop, ()):
+                yield (obj, RDF.type, cls)
+
+            # cls-svf1: x p y, y thuộc C  =>  x thuộc (p some C)
+            for restriction, cls in schema.some_values_from.get(prop, ()):
+                if cls == OWL.Thing or cls in types.get(obj, ()):
+                    for inferred in schema.closure_of(restriction):
+                        yield (subject, RDF.type, inferred)
+
+
+def materialize_instances(graph: Graph, schema: CompiledSchema) -> Set[Triple]:
+    # Bỏ qua các nút thuộc schema (lớp, thuộc tính, restriction)
+    schema_nodes = {s for s, _, _ in _schema_triples(graph)}
+
+    types: Dict[Node, Set[Node]] = defaultdict(set)
+    for s, o in graph.subject_objects(RDF.type):
+        types[s] |= schema.closure_of(o)
+
+    inferred: Set[Triple] = set()
+    pending = set(graph.subjects()) - schema_nodes
+    # Lặp tới điểm bất động vì kiểu mới có thể kích hoạt thêm restriction
+    while pending:
+        changed = set()
+        for subject in pending:
+            for triple in _subject_triples(graph, schema, subject, types):
+                if triple in inferred:
+                    continue
+                inferred.add(triple)
+                s, p, o = triple
+                if p == RDF.type and o not in types[s]:
+                    types[s].add(o)
+                    changed.add(s)
+        # Chủ thể có cạnh trỏ tới nút vừa đổi kiểu cần được xét lại
+        pending = {
+            s for node in changed for s in graph.subjects(None, node)
+            if s not in schema_nodes
+        }
+
+    return {t for t in inferred if t not in graph}
+
+
+def _node_types(graph: Graph, inferred: Graph, schema: CompiledSchema, node: Node) -> Set[Node]:
+    types = set(inferred.objects(node, RDF.type))
+    for cls in graph.objects(node, RDF.type):
+        types |= schema.closure_of(cls)
+    return types
+
+
+def _node_inferences(graph: Graph, inferred: Graph, schema: CompiledSchema, node: Node) -> Set[Triple]:
+    # Mọi triple suy diễn có chủ thể là node, tính từ các cạnh đi ra và đi vào của nó
+    types = {obj: _node_types(graph, inferred, schema, obj) for obj in set(graph.objects(node))}
+    triples = {t for t in _subject_triples(graph, schema, node, types) if t[0] == node}
+
+    # prp-rng: chỉ cần biết có ít nhất một cạnh đi vào, không duyệt hết các cạnh
+    for prop, classes in schema.ranges.items():
+        if next(graph.subjects(prop, node), None) is not None:
+            for cls in classes:
+                triples.add((node, RDF.type, cls))
+
+    return {t for t in triples if t not in graph}
+
+
+def rematerialize_nodes(graph: Graph, inferred: Graph, schema: CompiledSchema, nodes: Iterable[Node]) -> None:
+    # Suy diễn lại tại chỗ cho các nút bị sửa; lan sang nút khác chỉ khi kiểu của
+    # một nút thay đổi (có thể làm đổi thành viên restriction của nút trỏ tới nó)
+    schema_nodes = {s for s, _, _ in _schema_triples(graph)}
+    pending = {node for node in nodes if not isinstance(node, Literal)} - schema_nodes
+    while pending:
+        changed = set()
+        for node in pending:
+            old = set(inferred.triples((node, None, None)))
+            new = _node_inferences(graph, inferred, schema, node)
+            if old == new:
+                continue
+            for triple in old - new:
+                inferred.remove(triple)
+            for triple in new - old:
+                inferred.add(triple)
+            if {o for _, p, o in old if p == RDF.type} != {o for _, p, o in new if p == RDF.type}:
+                changed.add(node)
+        pending = {
+            s for node in changed for s in graph.subjects(None, node)
+            if s not in schema_nodes
+        }
+
+
+def read_cache_header(path: str) -> Tuple[Optional[str], Optional[str]]:
+    if not os.path.exists(path):
+        return None, None
+    schema_fp = source_fp = None
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            if line.startswith(SCHEMA_FINGERPRINT_HEADER):
+                schema_fp = line[len(SCHEMA_FINGERPRINT_HEADER):].strip()
+            elif line.startswith(SOURCE_FINGERPRINT_HEADER):
+                source_fp = line[len(SOURCE_FINGERPRINT_HEADER):].strip()
+            else:
+                break
+    return schema_fp, source_fp
+
+
+def write_cache(path: str, inferred: Graph, schema_fp: str, source_fp: str) -> None:
+    body = inferred.serialize(format="nt", encoding="utf-8")
+    header = f"{SCHEMA_FINGERPRINT_HEADER}{schema_fp}\n{SOURCE_FINGERPRINT_HEADER}{source_fp}\n"
+    # Tệp tạm riêng cho mỗi lần ghi: tiến trình con (cohort review) cũng có thể ghi cache
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+    with os.fdopen(fd, "wb") as f:
+        f.write(header.encode("utf-8"))
+        f.write(body)
+    os.replace(tmp_path, path)
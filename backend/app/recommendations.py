@@ -0,0 +1,279 @@
+import json
+import os
+import sqlite3
+import time
+from typing import List, Dict, Any, Optional
+
+from app.fuzzy_logic import calculate_hba1c_target_from_codes
+from app.jobs import job_handler, enqueue_job, PRIORITY_LOW
+from app.sparql_utils import ontology_graph, query_suitable_drugs
+from app.topsis import rank_drugs
+
+CURRENT_DIR = os.path.dirname(os.path.abspath(__file__))
+DATABASE_PATH = os.path.abspath(os.path.join(CURRENT_DIR, "..", "diabetes.db"))
+
+RECOMMENDATION_BATCH_SIZE = 100
+
+REFRESH_RECOMMENDATIONS_JOB = "refresh_recommendations"
+RECOMPUTE_ALL_RECOMMENDATIONS_JOB = "recompute_all_recommendations"
+
+# input_version tăng mỗi lần dữ liệu đầu vào thay đổi; computed_version là
+# phiên bản đã dùng để tính kết quả hiện tại. dirty = 1 khi hai giá trị lệch nhau.
+RECOMMENDATION_SCHEMA = """
+CREATE TABLE IF NOT EXISTS patient_recommendation (
+    patient_id INTEGER PRIMARY KEY,
+    input_version INTEGER NOT NULL DEFAULT 1,
+    computed_version INTEGER,
+    dirty INTEGER NOT NULL DEFAULT 1,
+    dirty_since REAL,
+    computed_at REAL,
+    eligible_drugs TEXT,
+    ranked_drugs TEXT,
+    hba1c_target REAL
+);
+
+CREATE INDEX IF NOT EXISTS idx_patient_recommendation_dirty
+    ON patient_recommendation (dirty_since) WHERE dirty = 1;
+"""
+
+def ensure_recommendation_schema(database_path: str = DATABASE_PATH) -> None:
+    conn = sqlite3.connect(database_path)
+    try:
+        cursor = conn.cursor()
+        cursor.executescript(RECOMMENDATION_SCHEMA)
+
+        # Bệnh nhân chưa có dòng khuyến nghị sẽ được tính lần đầu
+        cursor.execute(
+            """
+            INSERT INTO patient_recommendation (patient_id, dirty_since)
+            SELECT p.patient_id, ? FROM personal p
+            WHERE NOT EXISTS (
+                SELECT 1 FROM patient_recommendation r WHERE r.patient_id = p.patient_id
+            )
+            """,
+            (time.time(),)
+        )
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def mark_patient_dirty(cursor: sqlite3.Cursor, patient_id: int) -> None:
+    # Gọi trong cùng transaction với thao tác ghi dữ liệu bệnh nhân
+    cursor.execute(
+        """
+        INSERT INTO patient_recommendation (patient_id, input_version, dirty, dirty_since)
+        VALUES (?, 1, 1, ?)
+        ON CONFLICT (patient_id) DO UPDATE SET
+            input_version = input_version + 1,
+            dirty = 1,
+            dirty_since = coalesce(dirty_since, excluded.dirty_since)
+        """,
+        (patient_id, time.time())
+    )
+
+
+def schedule_recommendation_refresh() -> int:
+    # Các lần ghi liên tiếp được gộp vào một job đang chờ
+    return enqueue_job(REFRESH_RECOMMENDATIONS_JOB, coalesce_key=REFRESH_RECOMMENDATIONS_JOB)
+
+
+def _load_inputs(cursor: sqlite3.Cursor, patient_ids: List[int]) -> tuple:
+    placeholders = ", ".join("?" for _ in patient_ids)
+
+    cursor.execute(
+        f"""
+        SELECT
+            patient_id, hypoglycemia, disease_duration, life_expectancy,
+            important_comorbidities, vascular_complications, attitude, resources
+        FROM diabete
+        WHERE patient_id IN ({placeholders})
+        """,
+        patient_ids
+    )
+    diabetes = {row[0]: row[1:] for row in cursor.fetchall()}
+
+    cursor.execute(
+        f"""
+        SELECT DISTINCT patient_id, category
+        FROM medical_history
+        WHERE patient_id IN ({placeholders})
+        """,
+        patient_ids
+    )
+    histories: Dict[int, Dict[str, bool]] = {}
+    for patient_id, category in cursor.fetchall():
+        histories.setdefault(patient_id, {})[category] = True
+
+    return diabetes, histories
+
+
+def compute_recommendation(
+    g,
+    patient_id: int,
+    diabetes_codes: Optional[tuple],
+    history: Dict[str, Any]
+) -> Dict[str, Any]:
+    eligible = query_suitable_drugs(g, patient_id)
+    ranked = rank_drugs(eligible, history)
+
+    target = None
+    if diabetes_codes is not None:
+        hypoglycemia, duration, life, comorbidities, vascular, attitude, resources = diabetes_codes
+        target = calculate_hba1c_target_from_codes(
+            hypoglycemia, duration, life, comorbidities, vascular, attitude, resources
+        )
+
+    return {
+        "eligibleDrugs": eligible,
+        "rankedDrugs": ranked,
+        "hba1cTarget": target
+    }
+
+
+def refresh_dirty_recommendations(batch_size: int = RECOMMENDATION_BATCH_SIZE) -> int:
+    conn = sqlite3.connect(DATABASE_PATH)
+    try:
+        cursor = conn.cursor()
+        cursor.execute(
+            """
+            SELECT patient_id, input_version
+            FROM patient_recommendation
+            WHERE dirty = 1
+            ORDER BY dirty_since
+            LIMIT ?
+            """,
+            (batch_size,)
+        )
+        batch = cursor.fetchall()
+        if not batch:
+            return 0
+
+        patient_ids = [patient_id for patient_id, _ in batch]
+        diabetes, histories = _load_inputs(cursor, patient_ids)
+
+        now = time.time()
+
+        updates = []
+        for patient_id, input_version in batch:
+            result = compute_recommendation(
+                ontology_graph, patient_id, diabetes.get(patient_id), histories.get(patient_id, {})
+            )
+            updates.append((
+                input_version,
+                now,
+                json.dumps(result["eligibleDrugs"]),
+                json.dumps(result["rankedDrugs"]),
+                result["hba1cTarget"],
+                input_version,
+                input_version,
+                patient_id
+            ))
+
+        # Nếu bệnh nhân bị sửa trong lúc tính, input_version đã tăng nên dòng vẫn dirty
+        cursor.executemany(
+            """
+            UPDATE patient_recommendation SET
+                computed_version = ?,
+                computed_at = ?,
+                eligible_drugs = ?,
+                ranked_drugs = ?,
+                hba1c_target = ?,
+                dirty = CASE WHEN input_version = ? THEN 0 ELSE 1 END,
+                dirty_since = CASE WHEN input_version = ? THEN NULL ELSE dirty_since END
+            WHERE patient_id = ?
+            """,
+            updates
+        )
+        conn.commit()
+        return len(batch)
+    finally:
+        conn.close()
+
+
+def get_recommendation_logic(patient_id: int) -> Optional[Dict[str, Any]]:
+    try:
+        conn = sqlite3.connect(DATABASE_PATH)
+        cursor = conn.cursor()
+        cursor.execute(
+            """
+            SELECT
+                input_version, computed_version, dirty, dirty_since, computed_at,
+                eligible_drugs, ranked_drugs, hba1c_target
+            FROM patient_recommendation
+            WHERE patient_id = ?
+            """,
+            (patient_id,)
+        )
+        row = cursor.fetchone()
+        conn.close()
+
+        if not row:
+            return None
+
+        input_version, computed_version, dirty, dirty_since, computed_at, eligible, ranked, target = row
+        return {
+            "eligibleDrugs": json.loads(eligible) if eligible else [],
+            "rankedDrugs": json.loads(ranked) if ranked else [],
+            "hba1cTarget": target,
+            "inputVersion": input_version,
+            "computedVersion": computed_version,
+            "computedAt": computed_at,
+            "stale": bool(dirty),
+            "lagSeconds": round(time.time() - dirty_since, 3) if dirty and dirty_since else 0.0
+        }
+
+    except sqlite3.Error as e:
+        print(f"Database error: {e}")
+        raise Exception(f"Database error: {e}")
+
+
+def _count_dirty() -> int:
+    conn = sqlite3.connect(DATABASE_PATH)
+    try:
+        return conn.execute("SELECT COUNT(*) FROM patient_recommendation WHERE dirty = 1").fetchone()[0]
+    finally:
+        conn.close()
+
+
+def _drain_dirty_recommendations(report_progress) -> dict:
+    total = _count_dirty()
+    processed = 0
+    while True:
+        count = refresh_dirty_recommendations(RECOMMENDATION_BATCH_SIZE)
+        processed += count
+        report_progress(processed / total if total else 1.0, f"{processed}/{total} patients refreshed")
+        if count < RECOMMENDATION_BATCH_SIZE:
+            return {"processed": processed}
+
+
+@job_handler(REFRESH_RECOMMENDATIONS_JOB)
+def refresh_recommendations_job(payload: dict, report_progress) -> dict:
+    return _drain_dirty_recommendations(report_progress)
+
+
+@job_handler(RECOMPUTE_ALL_RECOMMENDATIONS_JOB)
+def recompute_all_recommendations_job(payload: dict, report_progress) -> dict:
+    conn = sqlite3.connect(DATABASE_PATH)
+    try:
+        conn.execute(
+            """
+            UPDATE patient_recommendation SET
+                input_version = input_version + 1,
+                dirty = 1,
+                dirty_since = coalesce(dirty_since, ?)
+            """,
+            (time.time(),)
+        )
+        conn.commit()
+    finally:
+        conn.close()
+    return _drain_dirty_recommendations(report_progress)
+
+
+def schedule_recompute_all_recommendations() -> int:
+    return enqueue_job(
+        RECOMPUTE_ALL_RECOMMENDATIONS_JOB,
+        coalesce_key=RECOMPUTE_ALL_RECOMMENDATIONS_JOB,
+        priority=PRIORITY_LOW
+    )
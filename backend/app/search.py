@@ -0,0 +1,281 @@
+import re
+import sqlite3
+import unicodedata
+from typing import List, Tuple
+
+from app.logic import DATABASE_PATH, PATIENT_LIST_COLUMNS, PATIENT_LIST_SELECT, patient_list_rows
+
+SEARCH_COLUMNS = ["name", "email", "phone", "address"]
+
+# Trọng số bm25 cho từng cột (name, email, phone, address)
+SEARCH_COLUMN_WEIGHTS = (10.0, 4.0, 4.0, 1.0)
+
+
+def _fold_sql(expr: str) -> str:
+    # unicode61 bỏ dấu tiếng Việt nhưng không chuyển "đ" thành "d"
+    return f"replace(replace(coalesce({expr}, ''), 'đ', 'd'), 'Đ', 'D')"
+
+
+def _folded_values(prefix: str) -> str:
+    return ", ".join(_fold_sql(f"{prefix}.{col}") for col in SEARCH_COLUMNS)
+
+
+def normalize_search_text(text: str) -> str:
+    # Bỏ dấu phía Python để khớp với cách chỉ mục lưu dữ liệu
+    text = text.replace("đ", "d").replace("Đ", "D")
+    decomposed = unicodedata.normalize("NFD", text)
+    return "".join(ch for ch in decomposed if not unicodedata.combining(ch)).lower()
+
+
+# Chữ cái có dấu tiếng Việt (Latin-1, Latin Extended, U+1EA0-U+1EF9) -> chữ không dấu
+_VIETNAMESE_LETTERS = (
+    [chr(c) for c in range(0xC0, 0x100)]
+    + list("ăĂđĐĩĨũŨơƠưƯ")
+    + [chr(c) for c in range(0x1EA0, 0x1EFA)]
+)
+
+
+def _name_fold_pairs() -> List[Tuple[str, str]]:
+    pairs = []
+    for ch in _VIETNAMESE_LETTERS:
+        base = normalize_search_text(ch)
+        if base != ch and len(base) == 1 and base.isascii():
+            pairs.append((ch, base))
+    return pairs
+
+
+# Bảng tra giống hệt chuỗi replace()/lower() trong trigger, dùng khi nạp lần đầu và khi tra cứu
+_NAME_FOLD_TABLE = {
+    **{ord(ch): base for ch, base in _name_fold_pairs()},
+    **{ord(ch): ch.lower() for ch in "ABCDEFGHIJKLMNOPQRSTUVWXYZ"},
+}
+
+
+def fold_name(name: str) -> str:
+    return (name or "").translate(_NAME_FOLD_TABLE).strip(" ")
+
+
+# SQLite báo "parser stack overflow" khi lồng quá ~30 hàm replace() nên bỏ dấu theo từng đợt
+NAME_FOLD_BATCH = 24
+
+
+def _name_fold_statements(where: str) -> str:
+    pairs = _name_fold_pairs()
+    statements = []
+    for start in range(0, len(pairs), NAME_FOLD_BATCH):
+        expr = "name_folded"
+        for ch, base in pairs[start:start + NAME_FOLD_BATCH]:
+            expr = f"replace({expr}, '{ch}', '{base}')"
+        statements.append(f"UPDATE patient_name_index SET name_folded = {expr} {where};")
+    # lower() của SQLite chỉ đổi chữ ASCII nên chạy sau khi đã bỏ dấu
+    statements.append(f"UPDATE patient_name_index SET name_folded = lower(trim(name_folded)) {where};")
+    return "\n    ".join(statements)
+
+
+SEARCH_SCHEMA = f"""
+CREATE VIRTUAL TABLE IF NOT EXISTS patient_search USING fts5(
+    {", ".join(SEARCH_COLUMNS)},
+    content='',
+    prefix='1 2 3',
+    tokenize="unicode61 remove_diacritics 2"
+);
+
+CREATE TRIGGER IF NOT EXISTS personal_search_ai AFTER INSERT ON personal BEGIN
+    INSERT INTO patient_search (rowid, {", ".join(SEARCH_COLUMNS)})
+    VALUES (new.patient_id, {_folded_values("new")});
+END;
+
+CREATE TRIGGER IF NOT EXISTS personal_search_ad AFTER DELETE ON personal BEGIN
+    INSERT INTO patient_search (patient_search, rowid, {", ".join(SEARCH_COLUMNS)})
+    VALUES ('delete', old.patient_id, {_folded_values("old")});
+END;
+
+CREATE TRIGGER IF NOT EXISTS personal_search_au AFTER UPDATE ON personal BEGIN
+    INSERT INTO patient_search (patient_search, rowid, {", ".join(SEARCH_COLUMNS)})
+    VALUES ('delete', old.patient_id, {_folded_values("old")});
+    INSERT INTO patient_search (rowid, {", ".join(SEARCH_COLUMNS)})
+    VALUES (new.patient_id, {_folded_values("new")});
+END;
+"""
+
+
+# Tên đã bỏ dấu cho gợi ý theo tiền tố (quét đoạn trên chỉ mục B-tree)
+NAME_INDEX_SCHEMA = f"""
+CREATE TABLE IF NOT EXISTS patient_name_index (
+    patient_id INTEGER PRIMARY KEY,
+    name_folded TEXT NOT NULL
+);
+
+CREATE TRIGGER IF NOT EXISTS personal_name_ai AFTER INSERT ON personal BEGIN
+    INSERT INTO patient_name_index (patient_id, name_folded)
+    VALUES (new.patient_id, coalesce(new.name, ''));
+    {_name_fold_statements("WHERE patient_id = new.patient_id")}
+END;
+
+CREATE TRIGGER IF NOT EXISTS personal_name_ad AFTER DELETE ON personal BEGIN
+    DELETE FROM patient_name_index WHERE patient_id = old.patient_id;
+END;
+
+CREATE TRIGGER IF NOT EXISTS personal_name_au AFTER UPDATE OF name ON personal BEGIN
+    INSERT OR REPLACE INTO patient_name_index (patient_id, name_folded)
+    VALUES (new.patient_id, coalesce(new.name, ''));
+    {_name_fold_statements("WHERE patient_id = new.patient_id")}
+END;
+"""
+
+
+def ensure_search_index(database_path: str = DATABASE_PATH) -> None:
+    conn = sqlite3.connect(database_path)
+    try:
+        cursor = conn.cursor()
+        cursor.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'patient_search'"
+        )
+        exists = cursor.fetchone() is not None
+
+        cursor.executescript(SEARCH_SCHEMA)
+
+        # Lần đầu tạo chỉ mục: nạp toàn bộ bệnh nhân hiện có
+        if not exists:
+            cursor.execute(
+                f"""
+                INSERT INTO patient_search (rowid, {", ".join(SEARCH_COLUMNS)})
+                SELECT p.patient_id, {_folded_values("p")} FROM personal p
+                """
+            )
+
+        cursor.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'patient_name_index'"
+        )
+        name_index_exists = cursor.fetchone() is not None
+
+        cursor.executescript(NAME_INDEX_SCHEMA)
+
+        if not name_index_exists:
+            # Bỏ dấu bằng Python: nhanh hơn nhiều so với chạy từng đợt UPDATE trên cả bảng
+            conn.create_function("fold_name", 1, fold_name, deterministic=True)
+            cursor.execute(
+                """
+                INSERT INTO patient_name_index (patient_id, name_folded)
+                SELECT patient_id, fold_name(name) FROM personal
+                """
+            )
+        # Tạo chỉ mục sau khi nạp: dựng một lần nhanh hơn cập nhật theo từng dòng
+        cursor.execute(
+            "CREATE INDEX IF NOT EXISTS idx_patient_name_folded ON patient_name_index (name_folded)"
+        )
+        # Lọc ứng viên tìm kiếm theo diabete cần tra theo patient_id
+        cursor.execute(
+            "CREATE INDEX IF NOT EXISTS idx_diabete_patient ON diabete (patient_id)"
+        )
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def build_match_query(query: str) -> str:
+    tokens = re.findall(r"\w+", normalize_search_text(query))
+    # Mỗi token đều là tiền tố, các token nối với nhau bằng AND
+    return " ".join(f'"{token}"*' for token in tokens)
+
+
+def _match_candidates_sql() -> str:
+    # Xếp hạng bằng bm25 trước rồi mới cắt top-k, để LIMIT giữ lại kết quả tốt nhất
+    weights = ", ".join(str(w) for w in SEARCH_COLUMN_WEIGHTS)
+    return f"""
+        SELECT rowid AS patient_id, bm25(patient_search, {weights}) AS score
+        FROM patient_search
+        WHERE patient_search MATCH ?
+            -- Danh sách chỉ hiện bệnh nhân có hồ sơ diabete: lọc trước LIMIT để không mất kết quả
+            AND EXISTS (SELECT 1 FROM diabete d WHERE d.patient_id = patient_search.rowid)
+        ORDER BY score, rowid
+        LIMIT ?
+    """
+
+
+# Kết quả tìm kiếm thay thế danh sách trên giao diện nên dùng cùng các cột
+SEARCH_RESULT_COLUMNS = PATIENT_LIST_COLUMNS
+
+TYPEAHEAD_COLUMNS = ["id", "name", "email", "phoneNumber"]
+
+
+def search_patients_logic(query: str, limit: int = 50, offset: int = 0) -> Tuple[List[str], List[tuple]]:
+    match = build_match_query(query)
+    if not match:
+        return SEARCH_RESULT_COLUMNS, []
+
+    try:
+        conn = sqlite3.connect(DATABASE_PATH)
+        cursor = conn.cursor()
+
+        cursor.execute(
+            f"""
+            {PATIENT_LIST_SELECT}
+            JOIN
+                ({_match_candidates_sql()}) m ON m.patient_id = p.patient_id
+            ORDER BY
+                m.score, p.patient_id
+            LIMIT ? OFFSET ?
+            """,
+            (match, offset + limit, limit, offset)
+        )
+
+        rows = patient_list_rows(cursor.fetchall())
+
+        conn.close()
+        return SEARCH_RESULT_COLUMNS, rows
+
+    except sqlite3.Error as e:
+        print(f"Database error: {e}")
+        raise Exception(f"Database error: {e}")
+
+    except Exception as e:
+        print(f"Error searching patients: {e}")
+        raise Exception(f"Error searching patients: {e}")
+
+
+def _prefix_upper_bound(prefix: str) -> str:
+    # Chuỗi nhỏ nhất lớn hơn mọi chuỗi bắt đầu bằng prefix (so sánh BINARY)
+    return prefix[:-1] + chr(ord(prefix[-1]) + 1)
+
+
+def typeahead_patients_logic(prefix: str, limit: int = 10) -> Tuple[List[str], List[tuple]]:
+    # Gợi ý theo tiền tố của tên: quét một đoạn của idx_patient_name_folded rồi dừng
+    # sau limit dòng, không phải xếp hạng toàn bộ kết quả FTS như /patients/search
+    folded = fold_name(" ".join(unicodedata.normalize("NFC", prefix).split()))
+    if not folded:
+        return TYPEAHEAD_COLUMNS, []
+
+    try:
+        conn = sqlite3.connect(DATABASE_PATH)
+        cursor = conn.cursor()
+
+        cursor.execute(
+            """
+            SELECT
+                p.patient_id, p.name, p.email, p.phone
+            FROM
+                patient_name_index n
+            JOIN
+                personal p ON p.patient_id = n.patient_id
+            WHERE
+                n.name_folded >= ? AND n.name_folded < ?
+            ORDER BY
+                n.name_folded, n.patient_id
+            LIMIT ?
+            """,
+            (folded, _prefix_upper_bound(folded), limit)
+        )
+
+        rows = cursor.fetchall()
+
+        conn.close()
+        return TYPEAHEAD_COLUMNS, rows
+
+    except sqlite3.Error as e:
+        print(f"Database error: {e}")
+        raise Exception(f"Database error: {e}")
+
+    except Exception as e:
+        print(f"Error fetching patient suggestions: {e}")
+        raise Exception(f"Error fetching patient suggestions: {e}")
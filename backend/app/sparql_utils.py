@@ -1,41 +1,181 @@
-from rdflib import Graph, Namespace
+from rdflib import Graph, Namespace, RDF
 import os
+import threading
+from app.jobs import job_handler
+from app.ontology_compiler import (
+    compile_schema, materialize_instances, rematerialize_nodes, schema_closure_triples,
+    schema_fingerprint, source_fingerprint, read_cache_header, write_cache
+)
 
 CURRENT_DIR = os.path.dirname(os.path.abspath(__file__))
 ONTOLOGY_PATH = os.path.abspath(os.path.join(CURRENT_DIR, "..", "diabetes.rdf"))
-def get_suitable_drugs(patient_id: int) -> list:
+# Các triple suy diễn được lưu riêng, không trộn vào ontology gốc
+INFERRED_PATH = os.path.abspath(os.path.join(CURRENT_DIR, "..", "diabetes.inferred.nt"))
+DIABETES = Namespace("http://www.semanticweb.org/admin/ontologies/2025/3/diabetes#")
+
+DRUG_CLASS = DIABETES["Glucose-Lowering_Agents"]
+# Ưu/nhược điểm là lớp con của Glucose-Lowering_Agents trong ontology nhưng là
+# giá trị của has_Advantages/has_Disadvantages chứ không phải thuốc
+DRUG_VALUE_CLASSES = (
+    DIABETES["Glucose-Lowering_Advantages"],
+    DIABETES["Glucose-Lowering_Disadvantages"],
+)
+
+def load_ontology() -> Graph:
     g = Graph()
     g.parse(ONTOLOGY_PATH, format="xml")
-    
-    DIABETES = Namespace("http://www.semanticweb.org/admin/ontologies/2025/3/diabetes#")
     g.bind("", DIABETES)
+    return g
+
+FLUSH_ONTOLOGY_JOB = "flush_ontology"
+
+# Ontology dùng chung trong tiến trình; mọi thao tác đọc/ghi phải giữ ONTOLOGY_LOCK
+ONTOLOGY_LOCK = threading.RLock()
+ontology_graph = load_ontology()
+inferred_graph = Graph()
+_compiled_schema = None
+_drug_candidates: list = []
+_flush_lock = threading.Lock()
+
+def _objects(g: Graph, subject, predicate) -> set:
+    # Giá trị khẳng định và giá trị suy diễn (ví dụ qua subPropertyOf)
+    return set(g.objects(subject, predicate)) | set(inferred_graph.objects(subject, predicate))
+
+def _collect_drug_candidates() -> list:
+    excluded = set()
+    for cls in DRUG_VALUE_CLASSES:
+        excluded.update(ontology_graph.subjects(RDF.type, cls))
+        excluded.update(inferred_graph.subjects(RDF.type, cls))
+
+    candidates = []
+    for graph in (ontology_graph, inferred_graph):
+        for drug in graph.subjects(RDF.type, DRUG_CLASS):
+            if drug not in excluded and drug not in candidates:
+                candidates.append(drug)
+    return candidates
+
+def _replace_inferred(triples) -> None:
+    inferred_graph.remove((None, None, None))
+    for triple in triples:
+        inferred_graph.add(triple)
+
+def compile_ontology(force: bool = False) -> bool:
+    # Trả về True nếu phải suy diễn lại, False nếu dùng được bao đóng đã lưu
+    global _compiled_schema, _drug_candidates
+
+    with open(ONTOLOGY_PATH, "rb") as f:
+        source_fp = source_fingerprint(f.read())
+
+    with ONTOLOGY_LOCK:
+        schema_fp = schema_fingerprint(ontology_graph)
+        cached_schema_fp, cached_source_fp = read_cache_header(INFERRED_PATH)
+
+        if not force and cached_schema_fp == schema_fp and cached_source_fp == source_fp:
+            cached = Graph()
+            cached.parse(INFERRED_PATH, format="nt")
+            _replace_inferred(cached)
+            _drug_candidates = _collect_drug_candidates()
+            return False
+
+        _compiled_schema = compile_schema(ontology_graph)
+        closure = {t for t in schema_closure_triples(_compiled_schema) if t not in ontology_graph}
+        _replace_inferred(closure | materialize_instances(ontology_graph, _compiled_schema))
+        _drug_candidates = _collect_drug_candidates()
+        write_cache(INFERRED_PATH, inferred_graph, schema_fp, source_fp)
+        return True
 
-    patient_individual = f"Patient{patient_id}"
+def refresh_inferences(nodes) -> None:
+    # Gọi (trong ONTOLOGY_LOCK) sau khi sửa dữ liệu cá thể, với chủ thể bị sửa cùng
+    # các đối tượng của cạnh cũ và mới. Schema không đổi nên chỉ suy diễn lại các nút đó
+    global _compiled_schema, _drug_candidates
 
-    query = f"""
-    PREFIX : <http://www.semanticweb.org/admin/ontologies/2025/3/diabetes#>
+    with ONTOLOGY_LOCK:
+        if _compiled_schema is None:
+            _compiled_schema = compile_schema(ontology_graph)
+        rematerialize_nodes(ontology_graph, inferred_graph, _compiled_schema, nodes)
+        _drug_candidates = _collect_drug_candidates()
 
-    SELECT ?drug
-    WHERE {{
-      ?drug a :Glucose-Lowering_Agents .
-      FILTER NOT EXISTS {{
-        ?drug :has_Disadvantages ?disadvantage .
-        :{patient_individual} :has_History_of_Diseases ?disadvantage .
-      }}
-      FILTER NOT EXISTS {{
-        :{patient_individual} :has_Adverse_Drug_Reactions ?drug .
-      }}
-    }}
-    """
+def _graph_from(triples, namespaces) -> Graph:
+    graph = Graph(bind_namespaces="none")
+    for prefix, namespace in namespaces:
+        graph.bind(prefix, namespace, override=True, replace=True)
+    graph.addN((s, p, o, graph) for s, p, o in triples)
+    return graph
 
-    results = g.query(query)
+def flush_ontology() -> None:
+    with _flush_lock:
+        # Chỉ chụp danh sách triple trong ONTOLOGY_LOCK; dựng Graph và serialize (chậm)
+        # chạy ngoài khóa để các request đọc/ghi ontology không phải chờ
+        with ONTOLOGY_LOCK:
+            namespaces = list(ontology_graph.namespaces())
+            ontology_triples = list(ontology_graph)
+            inferred_triples = list(inferred_graph)
 
-    suitable_drugs = []
-    for row in results:
-        drug_uri = row.drug
-        drug_name = str(drug_uri).split("#")[-1].replace("_", " ")
-        suitable_drugs.append(drug_name)
+        ontology = _graph_from(ontology_triples, namespaces)
+        inferred = _graph_from(inferred_triples, namespaces)
+        data = ontology.serialize(format="pretty-xml", encoding="utf-8")
+        schema_fp = schema_fingerprint(ontology)
+
+        # Ghi ra tệp tạm rồi thay thế để không bao giờ để lại tệp ghi dở
+        tmp_path = ONTOLOGY_PATH + ".tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, ONTOLOGY_PATH)
+        write_cache(INFERRED_PATH, inferred, schema_fp, source_fingerprint(data))
+
+@job_handler(FLUSH_ONTOLOGY_JOB)
+def flush_ontology_job(payload: dict, report_progress) -> dict:
+    flush_ontology()
+    return {"path": ONTOLOGY_PATH}
+
+compile_ontology()
+
+def _drug_name(drug_uri) -> str:
+    return str(drug_uri).split("#")[-1].replace("_", " ")
+
+def query_suitable_drugs(g: Graph, patient_id: int) -> list:
+    # Kiểu suy diễn đã được vật chất hóa sẵn nên chỉ cần tra chỉ mục triple,
+    # không chạy SPARQL hay suy luận cho từng truy vấn
+    patient = DIABETES[f"Patient{patient_id}"]
+
+    with ONTOLOGY_LOCK:
+        history = _objects(g, patient, DIABETES.has_History_of_Diseases)
+        adverse = _objects(g, patient, DIABETES.has_Adverse_Drug_Reactions)
+
+        results = []
+        for drug in _drug_candidates:
+            if drug in adverse:
+                continue
+            if history and not history.isdisjoint(_objects(g, drug, DIABETES.has_Disadvantages)):
+                continue
+            results.append(drug)
+
+    return [_drug_name(drug_uri) for drug_uri in results]
+
+def ontology_term(name: str):
+    # Cùng cách đặt URI với update_patient_history_logic khi ghi tiền sử / phản ứng thuốc
+    return DIABETES[name.replace(" ", "_")]
+
+def capture_drug_disadvantages() -> list:
+    # Chỉ chụp thuốc ứng viên và nhược điểm của chúng: nhỏ, không phụ thuộc số bệnh
+    # nhân và không bị thao tác ghi của bệnh nhân làm thay đổi
+    with ONTOLOGY_LOCK:
+        return [
+            (drug, _objects(ontology_graph, drug, DIABETES.has_Disadvantages))
+            for drug in _drug_candidates
+        ]
+
+def suitable_drugs_for(candidates: list, history: set, adverse: set) -> list:
+    # Cùng luật với query_suitable_drugs, trên tiền sử / phản ứng thuốc cho sẵn
+    return [
+        _drug_name(drug)
+        for drug, disadvantages in candidates
+        if drug not in adverse and history.isdisjoint(disadvantages)
+    ]
+
+def get_suitable_drugs(patient_id: int) -> list:
+    suitable_drugs = query_suitable_drugs(ontology_graph, patient_id)
 
     if len(suitable_drugs) == 0:
         return "Không có thuốc phù hợp"
-    return suitable_drugs
\ No newline at end of file
+    return suitable_drugs
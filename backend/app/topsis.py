@@ -0,0 +1,119 @@
+import math
+from typing import List, Dict, Any, Optional
+
+# Ma trận thuốc (giống trang TopsisAnalysis): mỗi hàng là một tiêu chí, mỗi cột là một thuốc
+DRUG_LABELS = ["MET", "SU", "TZDs", "DPP-4", "SGLT2", "GLP-1", "Insulins"]
+
+CRITERIA_LABELS = [
+    "Hypoglycemia",
+    "Weight",
+    "Renal/GU",
+    "GI Side",
+    "CHF",
+    "CVD",
+    "Bone",
+    "Cost"
+]
+
+CRITERIA_MATRIX = [
+    [3, 8, 1, 1, 2, 2, 8],  # Hypoglycemia Risk (1=thấp, 10=cao)
+    [5, 8, 3, 5, 1, 2, 8],  # Weight Effect (1=giảm, 10=tăng)
+    [8, 3, 5, 5, 7, 3, 2],  # Renal/GU Effect (1=tốt, 10=xấu)
+    [8, 3, 4, 7, 1, 8, 2],  # GI Side Effects (1=ít, 10=nhiều)
+    [2, 7, 8, 2, 1, 2, 7],  # CHF Risk (1=thấp, 10=cao)
+    [4, 5, 5, 2, 1, 3, 5],  # CVD Effect (1=tốt, 10=xấu)
+    [2, 3, 8, 5, 3, 2, 3],  # Bone Effect (1=tốt, 10=xấu)
+    [1, 3, 6, 8, 7, 9, 4],  # Cost (1=rẻ, 10=đắt)
+]
+
+DEFAULT_WEIGHTS = [0.20, 0.15, 0.15, 0.10, 0.15, 0.10, 0.05, 0.10]
+
+CRITERIA_TYPES = ["cost"] * len(CRITERIA_LABELS)
+
+# Hệ số tăng trọng số theo nhóm tiền sử bệnh (chỉ số tiêu chí, hệ số)
+HISTORY_WEIGHT_FACTORS = {
+    "hypo": (0, 1.5),
+    "weight": (1, 1.3),
+    "renalGu": (2, 1.4),
+    "giSx": (3, 1.4),
+    "chf": (4, 1.5),
+    "cvd": (5, 1.4),
+    "bone": (6, 1.3),
+}
+
+
+def weights_from_history(history: Dict[str, Any]) -> List[float]:
+    weights = list(DEFAULT_WEIGHTS)
+    for category, (index, factor) in HISTORY_WEIGHT_FACTORS.items():
+        if history.get(category):
+            weights[index] *= factor
+
+    # Chuẩn hóa trọng số để tổng bằng 1
+    total = sum(weights)
+    return [w / total for w in weights]
+
+
+def match_drug_labels(suitable_drugs: List[str]) -> List[int]:
+    # Tên thuốc trong ontology (vd. "Biguanides (MET)") được so khớp với nhãn theo chuỗi con
+    return [
+        idx for idx, label in enumerate(DRUG_LABELS)
+        if any(label in drug or drug in label for drug in suitable_drugs)
+    ]
+
+
+def calculate_topsis(
+    matrix: List[List[float]],
+    weights: List[float],
+    criteria_types: List[str]
+) -> List[float]:
+    # matrix: mỗi hàng là một phương án (thuốc), mỗi cột là một tiêu chí
+    rows = len(matrix)
+    if rows == 0:
+        return []
+    cols = len(matrix[0])
+
+    # Chuẩn hóa vector và áp dụng trọng số
+    weighted = [[0.0] * cols for _ in range(rows)]
+    for j in range(cols):
+        norm = math.sqrt(sum(matrix[i][j] ** 2 for i in range(rows)))
+        for i in range(rows):
+            weighted[i][j] = (matrix[i][j] / norm if norm else 0.0) * weights[j]
+
+    # Giải pháp lý tưởng và tiêu cực
+    ideal = []
+    negative = []
+    for j in range(cols):
+        column = [weighted[i][j] for i in range(rows)]
+        if criteria_types[j] == "benefit":
+            ideal.append(max(column))
+            negative.append(min(column))
+        else:
+            ideal.append(min(column))
+            negative.append(max(column))
+
+    # Độ gần tương đối
+    closeness = []
+    for i in range(rows):
+        d_ideal = math.sqrt(sum((weighted[i][j] - ideal[j]) ** 2 for j in range(cols)))
+        d_negative = math.sqrt(sum((weighted[i][j] - negative[j]) ** 2 for j in range(cols)))
+        total = d_ideal + d_negative
+        closeness.append(d_negative / total if total else 0.0)
+
+    return closeness
+
+
+def rank_drugs(suitable_drugs: List[str], history: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+    indices = match_drug_labels(suitable_drugs)
+    if not indices:
+        return []
+
+    # Chuyển ma trận tiêu chí x thuốc thành thuốc x tiêu chí
+    matrix = [[row[idx] for row in CRITERIA_MATRIX] for idx in indices]
+    weights = weights_from_history(history or {})
+    closeness = calculate_topsis(matrix, weights, CRITERIA_TYPES)
+
+    ranked = sorted(zip(indices, closeness), key=lambda item: item[1], reverse=True)
+    return [
+        {"drug": DRUG_LABELS[idx], "closeness": round(score, 6)}
+        for idx, score in ranked
+    ]
@@ -0,0 +1,70 @@
+import sqlite3
+
+import pytest
+
+from app import jobs
+
+
+@pytest.fixture
+def job_db(tmp_path, monkeypatch):
+    database_path = str(tmp_path / "jobs.db")
+    monkeypatch.setattr(jobs, "DATABASE_PATH", database_path)
+    jobs.ensure_job_schema(database_path)
+    return database_path
+
+
+def _statuses(database_path):
+    conn = sqlite3.connect(database_path)
+    try:
+        return dict(conn.execute("SELECT job_id, status FROM job ORDER BY job_id").fetchall())
+    finally:
+        conn.close()
+
+
+def test_restart_requeues_one_running_job_per_coalesce_key(job_db):
+    # Hai worker cùng nhận hai job gộp cùng khóa rồi tiến trình dừng đột ngột
+    conn = sqlite3.connect(job_db)
+    try:
+        first = jobs.enqueue_job("flush", coalesce_key="flush")
+        assert jobs._claim_next_job(conn)[0] == first
+        second = jobs.enqueue_job("flush", coalesce_key="flush")
+        assert jobs._claim_next_job(conn)[0] == second
+    finally:
+        conn.close()
+
+    jobs.ensure_job_schema(job_db)
+
+    assert _statuses(job_db) == {first: "merged", second: "queued"}
+
+
+def test_restart_merges_running_job_when_key_already_queued(job_db):
+    conn = sqlite3.connect(job_db)
+    try:
+        running = jobs.enqueue_job("flush", coalesce_key="flush")
+        jobs._claim_next_job(conn)
+        other = jobs.enqueue_job("other")
+        jobs._claim_next_job(conn)
+    finally:
+        conn.close()
+    queued = jobs.enqueue_job("flush", coalesce_key="flush")
+
+    jobs.ensure_job_schema(job_db)
+
+    assert _statuses(job_db) == {running: "merged", other: "queued", queued: "queued"}
+
+
+def test_unserializable_result_fails_the_job(job_db, monkeypatch):
+    monkeypatch.setitem(jobs._handlers, "bad-result", lambda payload, report: object())
+    job_id = jobs.enqueue_job("bad-result", max_attempts=1)
+
+    conn = sqlite3.connect(job_db)
+    try:
+        assert jobs.run_next_job(conn)
+        status, error = conn.execute(
+            "SELECT status, error FROM job WHERE job_id = ?", (job_id,)
+        ).fetchone()
+    finally:
+        conn.close()
+
+    assert status == "failed"
+    assert "JSON serializable" in error
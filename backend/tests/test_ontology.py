@@ -0,0 +1,73 @@
+import pytest
+from rdflib import Graph, RDF
+
+from app import sparql_utils
+from app.ontology_compiler import compile_schema, materialize_instances, schema_closure_triples
+from app.sparql_utils import DIABETES
+
+
+@pytest.fixture
+def ontology(monkeypatch):
+    # Bản sao riêng của ontology để không sửa đồ thị dùng chung của tiến trình
+    graph = sparql_utils.load_ontology()
+    schema = compile_schema(graph)
+    inferred = Graph()
+    for triple in _full_closure(graph):
+        inferred.add(triple)
+
+    monkeypatch.setattr(sparql_utils, "ontology_graph", graph)
+    monkeypatch.setattr(sparql_utils, "inferred_graph", inferred)
+    monkeypatch.setattr(sparql_utils, "_compiled_schema", schema)
+    monkeypatch.setattr(sparql_utils, "_drug_candidates", [])
+    return graph
+
+
+def _full_closure(graph):
+    schema = compile_schema(graph)
+    closure = {t for t in schema_closure_triples(schema) if t not in graph}
+    return closure | materialize_instances(graph, schema)
+
+
+def _set_history(graph, patient_uri, conditions, drugs):
+    # Giống update_patient_history_logic: thay toàn bộ cạnh tiền sử / phản ứng thuốc
+    with sparql_utils.ONTOLOGY_LOCK:
+        touched = {patient_uri} | set(graph.objects(patient_uri))
+        graph.remove((patient_uri, DIABETES.has_History_of_Diseases, None))
+        graph.remove((patient_uri, DIABETES.has_Adverse_Drug_Reactions, None))
+        for condition in conditions:
+            graph.add((patient_uri, DIABETES.has_History_of_Diseases, DIABETES[condition.replace(" ", "_")]))
+        for drug in drugs:
+            graph.add((patient_uri, DIABETES.has_Adverse_Drug_Reactions, DIABETES[drug.replace(" ", "_")]))
+        touched |= set(graph.objects(patient_uri))
+        sparql_utils.refresh_inferences(touched)
+
+
+def _assert_matches_full_pass(graph):
+    assert set(sparql_utils.inferred_graph) == _full_closure(graph)
+
+
+@pytest.mark.parametrize("conditions, drugs", [
+    (["Hypoglycemia", "Weight gain"], ["Insulins"]),
+    (["Heart failure hospitalizations", "Unlisted condition"], ["DPP-4", "SGLT2"]),
+    ([], []),
+])
+def test_rematerialize_existing_patient_matches_full_pass(ontology, conditions, drugs):
+    _set_history(ontology, DIABETES.Patient13, conditions, drugs)
+    _assert_matches_full_pass(ontology)
+
+
+def test_rematerialize_add_then_remove_edges_matches_full_pass(ontology):
+    patient_uri = DIABETES.Patient9001
+    with sparql_utils.ONTOLOGY_LOCK:
+        ontology.add((patient_uri, RDF.type, DIABETES.Patients))
+        sparql_utils.refresh_inferences([patient_uri])
+    _assert_matches_full_pass(ontology)
+
+    _set_history(ontology, patient_uri, ["Edema", "Gastrointestinal"], ["TZDs", "GLP-1"])
+    _assert_matches_full_pass(ontology)
+
+    _set_history(ontology, patient_uri, ["Edema"], [])
+    _assert_matches_full_pass(ontology)
+
+    _set_history(ontology, patient_uri, [], [])
+    _assert_matches_full_pass(ontology)
@@ -10,6 +10,10 @@ interface Patient {
   diseaseDuration: number;
   hba1cLevel: number;
   hypoglycemiaRisk: number;
+  hba1cTarget?: number | null;
+  recommendedDrug?: string | null;
+  recommendationStale?: boolean;
+  avatarThumbnail?: string | null;
 }
 
 const PatientList = () => {
@@ -17,6 +21,7 @@ const PatientList = () => {
   const [loading, setLoading] = useState<boolean>(true);
   const [error, setError] = useState<string | null>(null);
   const [searchTerm, setSearchTerm] = useState<string>('');
+  const [searchResults, setSearchResults] = useState<Patient[] | null>(null);
   const navigate = useNavigate();
 
   useEffect(() => {
@@ -43,10 +48,47 @@ const PatientList = () => {
     fetchPatients();
   }, []);
 
-  const filteredPatients = patients.filter(patient => 
-    patient.name.toLowerCase().includes(searchTerm.toLowerCase()) ||
-    patient.id.toLowerCase().includes(searchTerm.toLowerCase())
-  );
+  // Tìm kiếm phía server (chỉ mục FTS), có debounce để tránh gọi API mỗi lần gõ phím
+  useEffect(() => {
+    const query = searchTerm.trim();
+    if (!query) {
+      setSearchResults(null);
+      return;
+    }
+
+    const controller = new AbortController();
+    const timer = setTimeout(async () => {
+      try {
+        const response = await fetch(
+          `http://127.0.0.1:8000/api/patients/search?q=${encodeURIComponent(query)}`,
+          { signal: controller.signal }
+        );
+
+        if (!response.ok) {
+          throw new Error('Failed to search patients');
+        }
+
+        setSearchResults(await response.json());
+      } catch (err) {
+        if ((err as Error).name !== 'AbortError') {
+          console.error('Error searching patients:', err);
+        }
+      }
+    }, 250);
+
+    return () => {
+      clearTimeout(timer);
+      controller.abort();
+    };
+  }, [searchTerm]);
+
+  const filteredPatients = searchResults === null
+    ? patients
+    : [
+        // Giữ khả năng tìm theo ID như trước
+        ...patients.filter(patient => String(patient.id) === searchTerm.trim()),
+        ...searchResults.filter(patient => String(patient.id) !== searchTerm.trim()),
+      ];
 
   const handleViewPatient = (id: string) => {
     console.log(`Viewing details for patient ID: ${id}`);
@@ -112,6 +154,7 @@ const PatientList = () => {
                 <th>Disease Duration (years)</th>
                 <th>HbA1c Level</th>
                 <th>Risk of Hypoglycemia</th>
+                <th>HbA1c Target</th>
                 <th>Actions</th>
               </tr>
             </thead>
@@ -120,6 +163,14 @@ const PatientList = () => {
                 <tr key={patient.id} onClick={() => handleViewPatient(patient.id)}>
                   <td>{patient.id}</td>
                   <td className="patient-name">
+                    {patient.avatarThumbnail && (
+                      <img
+                        className="patient-avatar"
+                        src={`http://127.0.0.1:8000${patient.avatarThumbnail}`}
+                        alt=""
+                        loading="lazy"
+                      />
+                    )}
                     {patient.name}
                   </td>
                   <td>{patient.age}</td>
@@ -131,6 +182,12 @@ const PatientList = () => {
                       {getRiskClass(patient.hypoglycemiaRisk)}
                     </span>
                   </td>
+                  <td title={patient.recommendedDrug ? `Recommended: ${patient.recommendedDrug}` : undefined}>
+                    {patient.hba1cTarget != null ? `${patient.hba1cTarget}%` : '-'}
+                    {!!patient.recommendationStale && (
+                      <span className="stale-indicator" title="Recommendation is being recalculated"> (updating)</span>
+                    )}
+                  </td>
                   <td>
                     <button 
                       className="view-button"